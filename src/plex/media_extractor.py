@@ -16,6 +16,10 @@ DEBUG = os.environ.get('DEBUG', '0') == '1'
 # 控制是否输出媒体路径提取的DEBUG日志
 DEBUG_PATH_EXTRACTION = os.environ.get('DEBUG_PATH_EXTRACTION', str(DEBUG)) == '1'
 
+# 控制DEBUG模式下是否把完整XML写入temp_xml_debug.xml（整块写盘开销大，需单独开启）
+DEBUG_DUMP_XML = os.environ.get('DEBUG_DUMP_XML', '0') == '1'
+DEBUG_XML_DUMP_FILE = 'temp_xml_debug.xml'
+
 MEDIA_EXTS = {
     ".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv", ".mpeg", ".mpg", ".m4v",
     ".ts", ".iso", ".m2ts", ".mp3", ".wav", ".flac", ".aac", ".ogg", ".wma",
@@ -23,16 +27,43 @@ MEDIA_EXTS = {
     ".pdf", ".epub", ".mobi", ".cbz", ".cbr"
 }
 
+# 反斜杠转正斜杠的转换表，仅在路径包含反斜杠时使用
+_SLASH_TRANS = str.maketrans('\\', '/')
+
+_CDATA_START = '<![CDATA['
+_CDATA_END = ']]>'
+
+def _protect_cdata(xml_str: str):
+    """用占位符替换CDATA部分，返回(替换后的字符串, 占位符到原文的映射)
+
+    直接用str.find定位起止标记，没有CDATA时只做一次查找并原样返回。
+    """
+    cdata_map = {}
+    start = xml_str.find(_CDATA_START)
+    if start < 0:
+        return xml_str, cdata_map
+
+    parts = []
+    pos = 0
+    while start >= 0:
+        end = xml_str.find(_CDATA_END, start + len(_CDATA_START))
+        if end < 0:
+            # 未闭合的CDATA保持原样
+            break
+        end += len(_CDATA_END)
+        key = f"__CDATA_{len(cdata_map)}__"
+        cdata_map[key] = xml_str[start:end]
+        parts.append(xml_str[pos:start])
+        parts.append(key)
+        pos = end
+        start = xml_str.find(_CDATA_START, pos)
+    parts.append(xml_str[pos:])
+    return ''.join(parts), cdata_map
+
 def preprocess_xml(xml_str: str) -> str:
     """预处理XML字符串，修复未转义的双引号"""
     # 保护CDATA部分
-    cdata_pattern = r'<!\[CDATA\[.*?\]\]>'
-    cdata_map = {}
-    def replace_cdata(match):
-        key = f"__CDATA_{len(cdata_map)}__"
-        cdata_map[key] = match.group(0)
-        return key
-    xml_str = re.sub(cdata_pattern, replace_cdata, xml_str, flags=re.DOTALL)
+    xml_str, cdata_map = _protect_cdata(xml_str)
 
     # 修复属性值中的未转义双引号
     attr_pattern = r'(\w+)=\"([^\"]*?)(?:\"([^\"]*?))*\"'
@@ -52,76 +83,85 @@ def preprocess_xml(xml_str: str) -> str:
 
     return xml_str
 
-def extract_paths(xml_str: str):
-    """从XML字符串中提取媒体文件路径"""
-    # 打印XML前1000字符和后100字符（调试用）
+def iter_paths(xml_str: str):
+    """从XML字符串中逐个产出媒体文件路径（生成器，按出现顺序，不去重）"""
+    # 打印XML前1000字符和后100字符（调试用），切片只在DEBUG模式下构造
     if DEBUG:
         print(f"[DEBUG] XML响应前1000字符: {xml_str[:1000]}...", file=sys.stderr)
         print(f"[DEBUG] XML响应后100字符: {xml_str[-100:]}...", file=sys.stderr)
         print(f"[DEBUG] XML总长度: {len(xml_str)} 字符", file=sys.stderr)
 
-    # 保存XML到临时文件供检查
-    if DEBUG:
-        with open('temp_xml_debug.xml', 'w', encoding='utf-8') as f:
-            f.write(xml_str)
-        print(f"[DEBUG] XML已保存到temp_xml_debug.xml", file=sys.stderr)
+        # 保存XML到临时文件供检查（需同时设置DEBUG_DUMP_XML=1）
+        if DEBUG_DUMP_XML:
+            with open(DEBUG_XML_DUMP_FILE, 'w', encoding='utf-8') as f:
+                f.write(xml_str)
+            print(f"[DEBUG] XML已保存到{DEBUG_XML_DUMP_FILE}", file=sys.stderr)
 
     # 使用更健壮的正则表达式匹配Part标签中的file属性
     # 匹配<Part ... file="..." ...>格式，确保捕获完整路径
-    file_pattern = r'<Part\b[^>]*\bfile\s*=\s*"([^"]+)"'
-    paths = []
-    matches = re.finditer(file_pattern, xml_str, re.IGNORECASE)
-    found_matches = list(matches)
-    if DEBUG:
-        print(f"[DEBUG] 找到 {len(found_matches)} 个Part标签中的file属性匹配", file=sys.stderr)
-
-    # 如果没找到，尝试更宽松的匹配模式
-    if not found_matches:
-        file_pattern = r'file\s*=\s*"([^"]+)"'
-        matches = re.finditer(file_pattern, xml_str, re.IGNORECASE)
-        found_matches = list(matches)
+    # 如果一个都没找到，再尝试更宽松的匹配模式
+    match_count = 0
+    path_count = 0
+    for file_pattern, label in ((r'<Part\b[^>]*\bfile\s*=\s*"([^"]+)"', 'Part标签中的file属性'),
+                                (r'file\s*=\s*"([^"]+)"', '宽松模式file属性')):
+        for match in re.finditer(file_pattern, xml_str, re.IGNORECASE):
+            match_count += 1
+            try:
+                # 获取引号内的内容
+                path = match.group(1)
+                # 替换反斜杠为正斜杠（Linux路径通常不含反斜杠，跳过分配）
+                if '\\' in path:
+                    path = path.translate(_SLASH_TRANS)
+                if DEBUG_PATH_EXTRACTION:
+                    print(f"[DEBUG] 提取到文件路径: {path}", file=sys.stderr)
+                # 检查扩展名（不区分大小写）
+                if os.path.splitext(path)[1].lower() in MEDIA_EXTS:
+                    path_count += 1
+                    yield path
+            except Exception as e:
+                if DEBUG:
+                    print(f"[DEBUG] 处理匹配时出错: {str(e)}", file=sys.stderr)
         if DEBUG:
-            print(f"[DEBUG] 使用宽松模式找到 {len(found_matches)} 个file属性匹配", file=sys.stderr)
-
-    for match in found_matches:
-        try:
-            # 获取引号内的内容
-            path = match.group(1)
-            # 替换反斜杠为正斜杠
-            path = path.replace('\\', '/')
-            if DEBUG_PATH_EXTRACTION:
-                print(f"[DEBUG] 提取到文件路径: {path}", file=sys.stderr)
-            # 检查扩展名（不区分大小写）
-            if any(path.lower().endswith(ext) for ext in MEDIA_EXTS):
-                paths.append(path)
-        except Exception as e:
-            if DEBUG:
-                print(f"[DEBUG] 处理匹配时出错: {str(e)}", file=sys.stderr)
+            print(f"[DEBUG] 找到 {match_count} 个{label}匹配", file=sys.stderr)
+        if match_count:
+            break
 
     # 如果没找到，尝试匹配单引号
-    if not paths:
+    if not path_count:
         file_pattern = r'<Part\s+[^>]*file\s*=\s*\'([^\']+)\''
-        matches = re.finditer(file_pattern, xml_str, re.IGNORECASE)
-        found_matches = list(matches)
-        if DEBUG:
-            print(f"[DEBUG] 尝试单引号匹配，找到 {len(found_matches)} 个Part标签中的file属性匹配", file=sys.stderr)
-        for match in found_matches:
+        match_count = 0
+        for match in re.finditer(file_pattern, xml_str, re.IGNORECASE):
+            match_count += 1
             try:
-                path = match.group(1).replace('\\', '/')
+                path = match.group(1)
+                if '\\' in path:
+                    path = path.translate(_SLASH_TRANS)
                 if DEBUG:
                     if DEBUG_PATH_EXTRACTION:
                         print(f"[DEBUG] 单引号匹配提取到文件路径: {path}", file=sys.stderr)
-                if any(path.lower().endswith(ext) for ext in MEDIA_EXTS):
-                    paths.append(path)
+                if os.path.splitext(path)[1].lower() in MEDIA_EXTS:
+                    path_count += 1
+                    yield path
             except Exception as e:
                   if DEBUG:
                       print(f"[DEBUG] 单引号匹配处理时出错: {str(e)}", file=sys.stderr)
+        if DEBUG:
+            print(f"[DEBUG] 尝试单引号匹配，找到 {match_count} 个Part标签中的file属性匹配", file=sys.stderr)
 
-    # 去重并排序
-    unique_paths = sorted(set(paths))
     if DEBUG:
-        print(f"[DEBUG] 共提取到 {len(unique_paths)} 个媒体文件路径", file=sys.stderr)
-    return unique_paths
+        print(f"[DEBUG] 共提取到 {path_count} 个媒体文件路径（未去重）", file=sys.stderr)
+
+def extract_paths(xml_str: str):
+    """从XML字符串中提取媒体文件路径，返回去重并排序后的列表"""
+    return sorted(set(iter_paths(xml_str)))
+
+def print_unique_paths(paths):
+    """按出现顺序逐行输出路径，跳过重复项"""
+    seen = set()
+    for p in paths:
+        if p not in seen:
+            seen.add(p)
+            print(p)
 
 def extract_paths_from_library(library_id):
     # 根据媒体库ID从Plex服务器获取并提取文件路径
@@ -181,10 +221,8 @@ def extract_paths_from_library(library_id):
                 f.write(xml_in)
             print(f"[DEBUG] Plex响应XML已保存到: {xml_path}", file=sys.stderr)
 
-        # 提取路径
-        paths = extract_paths(xml_in)
-        for p in paths:
-            print(p)
+        # 提取路径，找到即输出
+        print_unique_paths(iter_paths(xml_in))
     except urllib.error.URLError as e:
         print(f"错误: URL请求失败: {str(e)}", file=sys.stderr)
         sys.exit(1)
@@ -202,9 +240,7 @@ def main():
     if sys.argv[1] == "extract_paths":
         xml_in = sys.stdin.read()
         try:
-            paths = extract_paths(xml_in)
-            for p in paths:
-                print(p)
+            print_unique_paths(iter_paths(xml_in))
         except Exception as e:
             print(f"错误: {str(e)}", file=sys.stderr)
             sys.exit(1)
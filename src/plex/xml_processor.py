@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 """
 零依赖容错版
-把 XML 当 HTML 解析，无需 ElementTree
+优先使用标准库 expat（C 实现）解析，XML 不规范时回退为按 HTML 解析，无需 ElementTree
 用法：
   $PYTHON_EXEC xml_processor_final.py parse_xml < bad.xml
 """
 import sys
-import html
+import os
+import xml.parsers.expat
 from html.parser import HTMLParser
 
 # 支持的扩展名
@@ -17,28 +18,31 @@ MEDIA_EXTS = {
     ".pdf", ".epub", ".mobi", ".cbz", ".cbr"
 }
 
-class FileExtractor(HTMLParser):
+# 反斜杠转正斜杠的转换表，仅在路径包含反斜杠时使用
+_SLASH_TRANS = str.maketrans('\\', '/')
+
+class FileExtractor:
     def __init__(self):
-        super().__init__()
         self.paths = []
 
     def handle_starttag(self, tag, attrs):
-        for k, v in attrs:
-            if k == 'file' and v:
-                path = html.unescape(v).replace('\\', '/').lower()
-                if any(path.endswith(ext) for ext in MEDIA_EXTS):
-                    self.paths.append(path)
+        v = attrs.get('file')
+        if v:
+            # expat和HTMLParser都已解析过属性中的实体引用，这里不再重复unescape
+            path = v.translate(_SLASH_TRANS).lower() if '\\' in v else v.lower()
+            if os.path.splitext(path)[1] in MEDIA_EXTS:
+                self.paths.append(path)
+
+    def handle_endtag(self, tag):
+        pass
 
-class PlexLibraryExtractor(HTMLParser):
+class PlexLibraryExtractor:
     def __init__(self):
-        super().__init__()
         self.media_libraries = []
         self.current_library = None
         self.in_media_container = False
 
-    def handle_starttag(self, tag, attrs):
-        attrs_dict = dict(attrs)
-        
+    def handle_starttag(self, tag, attrs_dict):
         # 开始处理MediaContainer
         if tag.lower() == 'mediacontainer':
             self.in_media_container = True
@@ -80,10 +84,52 @@ class PlexLibraryExtractor(HTMLParser):
         elif tag.lower() == 'mediacontainer':
             self.in_media_container = False
 
+# 所有expat解析器共享的名称驻留表，标签名/属性名（Part、file、key、title等）
+# 在多次请求之间复用同一个字符串对象
+_INTERN = {}
+
+class _HTMLFallbackParser(HTMLParser):
+    """XML不规范时使用的HTMLParser适配器，把回调转发给提取器（属性转换为字典）"""
+
+    def __init__(self, handler):
+        super().__init__()
+        self.handler = handler
+
+    def handle_starttag(self, tag, attrs):
+        self.handler.handle_starttag(tag, dict(attrs))
+
+    def handle_endtag(self, tag):
+        self.handler.handle_endtag(tag)
+
+def _parse(handler_cls, xml_str: str):
+    """用expat解析XML并驱动提取器回调，遇到ExpatError时回退到HTMLParser
+
+    Args:
+        handler_cls: 提取器类，需提供handle_starttag(tag, attrs)和handle_endtag(tag)
+        xml_str: XML格式的字符串
+
+    Returns:
+        完成解析的提取器实例
+    """
+    handler = handler_cls()
+    parser = xml.parsers.expat.ParserCreate(None, None, _INTERN)
+    parser.StartElementHandler = handler.handle_starttag
+    parser.EndElementHandler = handler.handle_endtag
+    try:
+        parser.Parse(xml_str, True)
+        return handler
+    except xml.parsers.expat.ExpatError:
+        pass
+
+    # 部分解析的结果不可用，用新的提取器按HTML重新解析
+    handler = handler_cls()
+    fallback = _HTMLFallbackParser(handler)
+    fallback.feed(xml_str)
+    fallback.close()
+    return handler
+
 def extract_paths(xml_str: str):
-    parser = FileExtractor()
-    parser.feed(xml_str)
-    parser.close()
+    parser = _parse(FileExtractor, xml_str)
     return sorted(set(parser.paths))
 
 def parse_plex_libraries(xml_str: str):
@@ -95,9 +141,7 @@ def parse_plex_libraries(xml_str: str):
     Returns:
         list: 媒体库列表，每个媒体库包含id、name、type和path属性
     """
-    parser = PlexLibraryExtractor()
-    parser.feed(xml_str)
-    parser.close()
+    parser = _parse(PlexLibraryExtractor, xml_str)
     return parser.media_libraries
 
 def main():
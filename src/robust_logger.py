@@ -2,12 +2,42 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import sys
 import logging
 import traceback
 import time
 from typing import Optional
 
+# 表示底层流已关闭/分离的错误信息，命中后尝试重置流
+_CLOSED_STREAM_RE = re.compile(r'buffer has been detached|i/o operation on closed file|broken pipe', re.IGNORECASE)
+
+class _FastFormatter(logging.Formatter):
+    """按秒缓存asctime的格式化器
+
+    同一秒内的日志记录复用上一次localtime+strftime的结果，只拼接毫秒部分。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (秒, 格式化后的时间字符串)，整体替换保证多线程下读到的是一致的一对值
+        self._time_cache = (None, '')
+
+    def formatTime(self, record, datefmt=None):
+        if datefmt:
+            return super().formatTime(record, datefmt)
+        second = int(record.created)
+        cached_second, cached_time = self._time_cache
+        if second != cached_second:
+            cached_time = time.strftime(self.default_time_format, self.converter(record.created))
+            self._time_cache = (second, cached_time)
+        return self.default_msec_format % (cached_time, record.msecs)
+
+LOG_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+
+# 后备日志共用的格式化器，避免每次写入都重新创建
+_FALLBACK_FMT = _FastFormatter(LOG_FORMAT)
+
 class RobustStreamHandler(logging.StreamHandler):
     def __init__(self, stream=None, fallback_log_file='fallback.log'):
         super().__init__(stream or sys.stdout)
@@ -52,8 +82,7 @@ class RobustStreamHandler(logging.StreamHandler):
                     self.stream.write((msg_bytes + terminator_bytes).decode('utf-8', errors='replace'))
                 self.flush()
             except (ValueError, IOError, OSError) as e:
-                error_msg = str(e).lower()
-                if any(phrase in error_msg for phrase in ['buffer has been detached', 'i/o operation on closed file', 'broken pipe']):
+                if _CLOSED_STREAM_RE.search(str(e)):
                     self.stream_closed = True
                     current_time = time.time()
                     if current_time - self.last_reset_time >= self.reset_cooldown:
@@ -130,26 +159,17 @@ class RobustStreamHandler(logging.StreamHandler):
         try:
             # 确保目录存在
             os.makedirs(os.path.dirname(os.path.abspath(self.fallback_log_file)), exist_ok=True)
-            with open(self.fallback_log_file, 'a', encoding='utf-8') as f:
-                formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
-                msg = formatter.format(record)
-                # 确保消息可以被正确编码
-                if isinstance(msg, str):
-                    msg_bytes = msg.encode('utf-8', errors='replace')
-                else:
-                    msg_bytes = str(msg).encode('utf-8', errors='replace')
-                # 直接写入字节
-                f.write(f'[FALLBACK] {error_msg}: '.encode('utf-8', errors='replace'))
-                f.write(msg_bytes)
-                f.write(b'\n')
+            msg = _FALLBACK_FMT.format(record)
+            # 文本模式由TextIOWrapper负责UTF-8编码，无法编码的字符替换处理
+            with open(self.fallback_log_file, 'a', encoding='utf-8', errors='replace') as f:
+                f.write(f'[FALLBACK] {error_msg}: {msg}\n')
         except Exception as e:
             # 如果写入后备日志也失败，尝试使用系统临时文件
             try:
                 import tempfile
                 temp_log_file = os.path.join(tempfile.gettempdir(), 'robust_logger_fallback.log')
-                with open(temp_log_file, 'a', encoding='utf-8') as f:
-                    formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
-                    msg = formatter.format(record)
+                with open(temp_log_file, 'a', encoding='utf-8', errors='replace') as f:
+                    msg = _FALLBACK_FMT.format(record)
                     f.write(f'[FALLBACK] {error_msg}: {msg} (Fallback to temp file failed: {e})\n')
             except:
                 # 最后的选择，尝试忽略错误
@@ -175,8 +195,7 @@ class RobustFileHandler(logging.FileHandler):
             fallback_path = os.path.join(os.path.dirname(self.baseFilename), 'fallback_' + os.path.basename(self.baseFilename))
             try:
                 with open(fallback_path, 'a', encoding=self.encoding or 'utf-8') as f:
-                    formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
-                    msg = formatter.format(record)
+                    msg = _FALLBACK_FMT.format(record)
                     f.write(f'[FILE ERROR] {e}: {msg}\n')
             except Exception:
                 # 所有方法都失败，忽略错误
@@ -211,13 +230,13 @@ def setup_robust_logging(
 
     # 添加健壮的StreamHandler
     stream_handler = RobustStreamHandler(sys.stdout, fallback_log_file)
-    stream_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+    stream_handler.setFormatter(_FastFormatter(LOG_FORMAT))
     root_logger.addHandler(stream_handler)
 
     # 添加健壮的FileHandler
     try:
         file_handler = RobustFileHandler(log_file)
-        file_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+        file_handler.setFormatter(_FastFormatter(LOG_FORMAT))
         root_logger.addHandler(file_handler)
     except Exception as e:
         # 记录无法创建文件处理器的错误
@@ -27,6 +27,16 @@ except ImportError:
 # 检查DEBUG环境变量
 debug_mode = os.environ.get('DEBUG', '0') == '1'
 
+# 日志级别名称到日志器方法名的映射，未知级别按INFO处理
+_LEVEL_METHODS = {
+    'DEBUG': 'debug',
+    'INFO': 'info',
+    'WARN': 'warning',
+    'WARNING': 'warning',
+    'ERROR': 'error',
+    'CRITICAL': 'critical',
+}
+
 def main():
     if len(sys.argv) < 2:
         print("用法: robust_logger_wrapper.py <日志级别> <日志消息>", file=sys.stderr)
@@ -54,7 +64,6 @@ def main():
         except Exception as e:
             log_message_parts.append(f'[ENCODING_ERROR: {str(e)}]')
     log_message = ' '.join(log_message_parts)
-    debug_mode = os.environ.get('DEBUG', '0') == '1'
 
     # 配置日志
     if ROBUST_LOGGING_AVAILABLE:
@@ -85,18 +94,7 @@ def main():
     # 这行日志会在每次调用时重复输出，已经移除以避免日志冗余
 
     # 根据日志级别记录消息
-    if log_level == 'DEBUG':
-        logger.debug(log_message)
-    elif log_level == 'INFO':
-        logger.info(log_message)
-    elif log_level == 'WARN' or log_level == 'WARNING':
-        logger.warning(log_message)
-    elif log_level == 'ERROR':
-        logger.error(log_message)
-    elif log_level == 'CRITICAL':
-        logger.critical(log_message)
-    else:
-        logger.info(log_message)
+    getattr(logger, _LEVEL_METHODS.get(log_level, 'info'))(log_message)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,20 +1,21 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import os
+import math
 import time
 import threading
 import socket
+from array import array
 import sys
 from smb.SMBConnection import SMBConnection
+from smb.base import NotConnectedError, SMBTimeout
+from smb.smb_structs import OperationFailure
+from collections import OrderedDict, deque
 import logging
 
 # 导入超时控制模块
-from .utils.timeout_decorator import timeout, run_with_timeout, TimeoutContext
 from .utils.environment import env_detector
 
-# 设置socket超时时间
-socket.setdefaulttimeout(30)
-
 # 日志配置
 logger = logging.getLogger(__name__)
 
@@ -26,28 +27,249 @@ IS_DARWIN = sys.platform == 'darwin'
 # Docker环境检测 - 使用统一的环境检测器
 IS_DOCKER = env_detector.is_docker()
 
+# 平台相关的路径分隔符在导入时确定，避免每次调用都判断平台
+_SEP = '\\' if IS_WINDOWS else '/'
+_FOREIGN_SEP = '/' if IS_WINDOWS else '\\'
+_ROOT_PATHS = frozenset(('', '/', '\\'))
+
 # 工具函数，用于获取平台特定路径分隔符
 def get_path_separator(path):
     """根据平台和路径内容返回适当的路径分隔符"""
-    if '\\' in path:
-        return '\\'
-    return '/' if not IS_WINDOWS else '\\'
+    return '\\' if '\\' in path else _SEP
 
 # 工具函数，用于规范化路径分隔符
 def normalize_path_separator(path):
     """根据当前平台规范化路径分隔符"""
     if not path:
         return path
-    if IS_WINDOWS:
-        return path.replace('/', '\\')
+    return path.replace(_FOREIGN_SEP, _SEP)
+
+# 工具函数，为单个SMB连接的socket设置超时
+def _apply_socket_timeout(conn, seconds):
+    """只作用于该连接自己的socket，不修改进程级的socket默认超时，
+    避免多个线程（SMB操作与保活线程）互相覆盖对方的超时设置"""
+    sock = getattr(conn, 'sock', None)
+    if sock is not None:
+        sock.settimeout(seconds)
+
+# TCP握手阶段的超时时间（秒），服务器不可达时不必等待完整的SMB连接超时
+SMB_TCP_CONNECT_TIMEOUT = float(os.environ.get('SMB_TCP_CONNECT_TIMEOUT', '5'))
+
+# 工具函数，探测SMB端口是否可以建立TCP连接
+def _probe_tcp(server, port, timeout):
+    """在timeout秒内确认TCP握手能够完成
+
+    pysmb在connect()内部自行创建socket，无法接管已经连好的socket，
+    因此只在新建连接前做一次握手探测，让不可达的服务器尽快失败。
+    socket.create_connection依次尝试解析出的各个地址，等待握手时不受文件描述符数值上限的限制。
+
+    Raises:
+        socket.timeout: 超时仍未完成握手
+        OSError: 握手失败（拒绝连接、网络不可达、无法解析地址等）
+    """
+    socket.create_connection((server, port), timeout=timeout).close()
+
+# 工具函数，调整SMB连接socket的TCP参数
+# TCP保活参数（秒）：空闲多久后开始探测、探测间隔、判定连接失效前的探测次数
+SMB_TCP_KEEPIDLE = 30
+SMB_TCP_KEEPINTVL = 15
+SMB_TCP_KEEPCNT = 3
+
+def _tune_socket(conn):
+    """SMB是大量小请求/响应的往返，关闭Nagle算法避免每次请求额外等待；
+    收发缓冲区不显式设置，保留内核的自动调整；
+    不设置TCP_QUICKACK：Linux在下一次确认后会自动清除该选项，连接后设置一次对之后的请求无效；
+    各选项按平台可用性设置，任何一项失败都不影响连接本身"""
+    sock = getattr(conn, 'sock', None)
+    if sock is None:
+        return
+    options = [
+        (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+        # 由内核探测对端是否存活，不需要为每个共享运行保活线程
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ]
+    # 空闲时间选项在Linux上是TCP_KEEPIDLE，在macOS上是TCP_KEEPALIVE
+    keepidle = getattr(socket, 'TCP_KEEPIDLE', None) or getattr(socket, 'TCP_KEEPALIVE', None)
+    if keepidle is not None:
+        options.append((socket.IPPROTO_TCP, keepidle, SMB_TCP_KEEPIDLE))
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, SMB_TCP_KEEPINTVL))
+    if hasattr(socket, 'TCP_KEEPCNT'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPCNT, SMB_TCP_KEEPCNT))
+    # 不设置TCP_USER_TIMEOUT：连接池中的socket会被复用于操作超时更长的listPath等请求，
+    # 固定的内核超时可能中断缓慢但正常的目录列出，失效连接由保活探测发现
+    for level, option, value in options:
+        try:
+            sock.setsockopt(level, option, value)
+        except OSError as e:
+            logger.debug(f"[SMB] 设置socket选项失败: {option}={value} - {str(e)}")
+
+# 网络健康状态的衰减时间常数（秒），越早的连接结果权重按exp(-age/常数)衰减
+NETWORK_HEALTH_DECAY_SECONDS = 300.0
+
+# 保活时发送的SMB echo数据
+_KEEPALIVE_ECHO_DATA = b'plexAutoScan'
+
+# 连接在最近一次成功操作后的这段时间内（保活间隔的比例）直接视为可用，不再探测
+SMB_CONN_FRESH_RATIO = 0.8
+
+# 表示连接本身已失效的异常（socket.timeout是socket.error的子类），出现时将连接从连接池移除
+_CONNECTION_ERRORS = (socket.error, NotConnectedError, SMBTimeout)
+
+def _probe_connection(conn):
+    """真正探测连接状态，只在缓存的成功时间过期后使用"""
+    if getattr(conn, 'sock', None) is None:
+        return False
+    try:
+        return conn.is_connected()
+    except Exception as e:
+        logger.debug(f"[SMB] 探测SMB连接状态失败: {str(e)}")
+        return False
+
+# SMB目录查询中的通配符，文件名包含这些字符时不能直接作为查询模式
+_SMB_WILDCARDS = frozenset('*?<>"')
+
+# 查询模式没有匹配的条目时服务器返回的NT状态码
+_STATUS_NO_SUCH_FILE = 0xC000000F
+
+def _is_no_such_file(error):
+    """OperationFailure是否由STATUS_NO_SUCH_FILE引起"""
+    return any(getattr(message, 'status', None) == _STATUS_NO_SUCH_FILE
+               for message in getattr(error, 'smb_messages', None) or ())
+
+def _remaining(deadline):
+    """距截止时间（time.monotonic）剩余的秒数，至少为1秒"""
+    return max(1.0, deadline - time.monotonic())
+
+def _find_entry(conn, share, dir_path, file_name, deadline):
+    """在目录中查找指定名称的条目，返回其属性，不存在时返回None
+
+    把文件名作为查询模式交给服务器过滤，只返回匹配的条目，
+    不必传输并遍历整个目录；服务器不支持时退回完整列出目录。
+    """
+    if _SMB_WILDCARDS.isdisjoint(file_name):
+        try:
+            entries = conn.listPath(share, dir_path, pattern=file_name, timeout=_remaining(deadline))
+        except OperationFailure as e:
+            # 没有匹配的条目时服务器返回STATUS_NO_SUCH_FILE；目录不存在、拒绝访问等其他错误照常抛出
+            if _is_no_such_file(e):
+                return None
+            raise
+        except (TypeError, NotImplementedError):
+            entries = conn.listPath(share, dir_path, timeout=_remaining(deadline))
     else:
-        return path.replace('\\', '/')
+        entries = conn.listPath(share, dir_path, timeout=_remaining(deadline))
+    # 服务器端匹配不区分大小写，这里仍按原来的方式精确比较名称
+    for name, attrs in entries:
+        if name == file_name:
+            return attrs
+    return None
+
+class _ConnPool:
+    """连接池分片：按列存储连接键、连接对象和最近一次成功操作的时间（time.monotonic）
+
+    连接键到下标的映射单独保存，并按最近使用顺序排列（LRU），超过容量时淘汰最久未用的连接；
+    统计活跃连接时只需扫描连续的时间戳数组。删除时用最后一个元素填补空位，保持各列紧凑。
+    调用方负责加锁。
+    """
+
+    def __init__(self, maxlen=None):
+        self.maxlen = maxlen
+        self.index = OrderedDict()
+        self.keys = []
+        self.conns = []
+        self.last_ok = array('d')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def get(self, key):
+        """返回(连接, 最近成功时间)，不存在时返回(None, 0.0)"""
+        slot = self.index.get(key)
+        if slot is None:
+            return None, 0.0
+        self.index.move_to_end(key)
+        return self.conns[slot], self.last_ok[slot]
+
+    def put(self, key, conn):
+        """加入或替换连接，并记录为刚成功使用
+
+        Returns:
+            被淘汰的最久未用连接（由调用方在锁外关闭），没有淘汰时返回None
+        """
+        now = time.monotonic()
+        slot = self.index.get(key)
+        if slot is not None:
+            self.conns[slot] = conn
+            self.last_ok[slot] = now
+            self.index.move_to_end(key)
+            return None
+
+        evicted = None
+        if self.maxlen is not None and len(self.keys) >= self.maxlen:
+            evicted = self.pop(next(iter(self.index)))
+        self.index[key] = len(self.keys)
+        self.keys.append(key)
+        self.conns.append(conn)
+        self.last_ok.append(now)
+        return evicted
+
+    def touch(self, key):
+        """更新连接的最近成功时间"""
+        slot = self.index.get(key)
+        if slot is not None:
+            self.last_ok[slot] = time.monotonic()
+            self.index.move_to_end(key)
+
+    def pop(self, key):
+        """移除并返回连接，不存在时返回None"""
+        slot = self.index.pop(key, None)
+        if slot is None:
+            return None
+        conn = self.conns[slot]
+        last = len(self.keys) - 1
+        if slot != last:
+            # 用最后一个元素填补被删除的位置
+            moved_key = self.keys[last]
+            self.keys[slot] = moved_key
+            self.conns[slot] = self.conns[last]
+            self.last_ok[slot] = self.last_ok[last]
+            self.index[moved_key] = slot
+        self.keys.pop()
+        self.conns.pop()
+        self.last_ok.pop()
+        return conn
+
+    def split_by_freshness(self, fresh_window):
+        """统计最近成功过的连接数，并返回其余需要探测的连接列表（不做网络I/O，可在持有分片锁时调用）"""
+        threshold = time.monotonic() - fresh_window
+        fresh = 0
+        stale = []
+        for slot, ok in enumerate(self.last_ok):
+            if ok > threshold:
+                fresh += 1
+            else:
+                stale.append(self.conns[slot])
+        return fresh, stale
+
+# 快速失败（类似failFastIfOffline）：同一服务器连续连接失败达到阈值后，
+# 在冷却时间内直接返回错误，不再发起TCP连接
+SMB_FAST_FAIL_THRESHOLD = 5
+SMB_FAST_FAIL_COOLDOWN = 10  # 秒
+
+# 连接池分片数量（必须是2的幂），按服务器分片以减少不同服务器之间的锁竞争
+SMB_POOL_SHARDS = 16
+
+# 每个连接池分片最多保留的连接数，超出时关闭最久未使用的连接，避免文件描述符无限增长
+SMB_POOL_MAX = int(os.environ.get('SMB_POOL_MAX', '64'))
 
 class SMBManager:
     """SMB连接管理类，提供SMB文件系统操作接口"""
     _instance = None
-    _connections = {}
-    _lock = threading.RLock()  # 添加可重入锁以确保线程安全
+    _lock = threading.Lock()  # 单例创建使用的类级别锁
 
     @classmethod
     def get_instance(cls):
@@ -59,8 +281,12 @@ class SMBManager:
 
     def __init__(self):
         """初始化SMB管理器"""
-        self._connections = {}
-        self._lock = threading.RLock()  # 实例级别的锁
+        # 连接池按服务器分片，每个分片有独立的锁；网络健康状态使用单独的锁，
+        # 保证connect()不会因为健康状态更新而阻塞
+        # 持有这些锁时不会再调用其他需要加锁的方法，因此使用不可重入的普通锁
+        self._shards = [_ConnPool(SMB_POOL_MAX) for _ in range(SMB_POOL_SHARDS)]
+        self._shard_locks = [threading.Lock() for _ in range(SMB_POOL_SHARDS)]
+        self._health_lock = threading.Lock()
         # 从环境变量获取SMB默认配置
         self.default_user = os.environ.get('SMB_USER', '')
         self.default_password = os.environ.get('SMB_PASSWORD', '')
@@ -68,13 +294,23 @@ class SMBManager:
         
         # 网络状况监控
         self.network_health = 1.0  # 1.0表示最佳网络状况
-        self.last_connection_attempts = []  # 记录最近连接尝试的结果
         self.max_attempts_history = 10  # 保留的连接尝试历史记录数
+        self.last_connection_attempts = deque(maxlen=self.max_attempts_history)  # 记录最近连接尝试的结果
+        # 增量维护的加权和：每次更新先按时间衰减，再加入新样本，无需重新遍历历史记录
+        self._health_weight = 0.0
+        self._health_weighted_sum = 0.0
+        self._health_last_update = None
+        # 历史记录中明确为好/差的结果数量，随deque的追加和淘汰增量维护
+        self._health_success_count = 0
+        self._health_failure_count = 0
+        # 每个服务器的连续连接失败次数和最近一次失败时间，用于快速失败
+        self._connect_failures = {}
         
         # 根据平台和环境调整默认参数
         # 优化Docker环境下的参数
         self.default_timeout = 45 if IS_DOCKER else 30  # 减少Docker环境的默认超时
         self.default_keepalive_interval = 45 if IS_DOCKER else 30  # 减少Docker环境的默认保活间隔
+        self._sign_options = 2 if IS_DOCKER else 1  # 在Docker环境中更严格的签名选项
         
         # 动态超时调整参数
         self.timeout_factor_high = 1.5  # 网络状况差时的超时因子
@@ -83,7 +319,34 @@ class SMBManager:
         # 记录初始化信息
         logger.info(f"SMB管理器已初始化 - 平台: {sys.platform}, Docker环境: {IS_DOCKER}")
 
-    @timeout(seconds=60, error_message="SMB连接超时")
+    def _shard(self, server):
+        """返回服务器所在连接池分片的(锁, _ConnPool)"""
+        index = hash(server) & (SMB_POOL_SHARDS - 1)
+        return self._shard_locks[index], self._shards[index]
+
+    def _conn_key(self, server, share, user=None):
+        """连接池键：(服务器, 共享, 用户)元组，服务器和共享名驻留以复用同一字符串对象"""
+        return (sys.intern(server), sys.intern(share), user or self.default_user)
+
+    def _mark_ok(self, server, share, user=None):
+        """记录连接刚完成一次成功操作"""
+        conn_key = self._conn_key(server, share, user)
+        shard_lock, connections = self._shard(server)
+        with shard_lock:
+            connections.touch(conn_key)
+
+    def _invalidate(self, server, share, user=None):
+        """连接出现网络/会话错误后，将其关闭并移出连接池"""
+        conn_key = self._conn_key(server, share, user)
+        shard_lock, connections = self._shard(server)
+        with shard_lock:
+            conn = connections.pop(conn_key)
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
     def connect(self, server, share, user=None, password=None, domain=None, timeout=None):
         """建立SMB连接
 
@@ -98,8 +361,8 @@ class SMBManager:
         Returns:
             tuple: (连接成功的连接对象, 错误信息)
         """
-        # 记录开始时间
-        start_time = time.time()
+        # 记录开始时间（单调时钟，不受系统时间调整影响）
+        start_time = time.monotonic()
         
         # 使用默认值或提供的值
         user = user or self.default_user
@@ -108,24 +371,37 @@ class SMBManager:
         timeout = timeout or self.default_timeout
 
         # 检查是否已有连接
-        conn_key = f"{server}:{share}:{user}"
+        conn_key = self._conn_key(server, share, user)
         
         # 线程安全地检查和创建连接
-        with self._lock:
-            if conn_key in self._connections:
-                conn = self._connections[conn_key]
-                if conn.is_connected():
+        shard_lock, connections = self._shard(server)
+        with shard_lock:
+            conn, last_ok = connections.get(conn_key)
+            if conn is not None:
+                # 最近成功使用过的连接直接复用，否则才真正探测连接状态
+                fresh_window = self.default_keepalive_interval * SMB_CONN_FRESH_RATIO
+                if time.monotonic() - last_ok < fresh_window or _probe_connection(conn):
                     logger.debug(f"使用现有SMB连接: {server}\\{share}")
                     return conn, None
                 else:
                     logger.debug(f"移除断开的SMB连接: {server}\\{share}")
-                    del self._connections[conn_key]
+                    connections.pop(conn_key)
+
+        # 服务器最近持续不可达时直接失败，避免每次调用都等待连接超时
+        fast_fail_err = self._check_fast_fail(server)
+        if fast_fail_err:
+            logger.debug(f"[SMB] {fast_fail_err}: {server}\\{share}")
+            return None, f"{fast_fail_err}: {server}\\{share}"
 
+        established = False
+        # 当前阶段（TCP握手探测或SMB连接）的超时时间，超时后按实际到期的时间报告
+        phase_timeout = timeout
         try:
-            # 保存原始超时设置并设置新的超时
-            original_timeout = socket.getdefaulttimeout()
-            socket.setdefaulttimeout(timeout)
-            
+            # 先在较短的时间内确认TCP握手可以完成，服务器不可达时快速失败
+            phase_timeout = min(timeout, SMB_TCP_CONNECT_TIMEOUT)
+            _probe_tcp(server, 445, phase_timeout)
+            phase_timeout = timeout
+
             # 创建连接对象，根据环境调整参数
             conn = SMBConnection(
                 username=user,
@@ -134,26 +410,35 @@ class SMBManager:
                 remote_name=server,
                 domain=domain,
                 use_ntlm_v2=True,
-                sign_options=2 if IS_DOCKER else 1,  # 在Docker环境中更严格的签名选项
+                sign_options=self._sign_options,
                 is_direct_tcp=True  # 始终使用直接TCP连接，提高连接稳定性
             )
 
-            # 连接服务器，使用超时参数
-            connected = conn.connect(server, 445)
+            # 连接服务器，使用超时参数（pysmb在该连接自己的socket上应用超时）
+            connected = conn.connect(server, 445, timeout=timeout)
             if not connected:
                 logger.error(f"[SMB] 无法连接到SMB服务器: {server}\\{share}")
                 return None, f"无法连接到SMB服务器: {server}\\{share}"
+            _apply_socket_timeout(conn, timeout)
+            _tune_socket(conn)
 
             # 线程安全地存储连接
-            with self._lock:
-                self._connections[conn_key] = conn
+            with shard_lock:
+                evicted = connections.put(conn_key, conn)
+            if evicted is not None:
+                logger.debug(f"[SMB] 连接池已满，关闭最久未使用的连接")
+                try:
+                    evicted.close()
+                except Exception as e:
+                    logger.warning(f"[SMB] 关闭被淘汰的SMB连接时出错: {str(e)}")
             
+            established = True
             logger.info(f"[SMB] 成功连接到SMB服务器: {server}\\{share}")
             return conn, None
 
         except socket.timeout:
-            logger.error(f"[SMB] SMB连接超时: {server}\\{share}（{timeout}秒后）")
-            return None, f"SMB连接超时: {server}\\{share}（{timeout}秒后）"
+            logger.error(f"[SMB] SMB连接超时: {server}\\{share}（{phase_timeout}秒后）")
+            return None, f"SMB连接超时: {server}\\{share}（{phase_timeout}秒后）"
         except socket.error as e:
             logger.error(f"[SMB] SMB网络错误: {str(e)} - 服务器: {server}\\{share}")
             return None, f"SMB网络错误: {str(e)} - 服务器: {server}\\{share}"
@@ -162,59 +447,81 @@ class SMBManager:
             logger.error(f"[SMB] 错误详情 - 平台: {sys.platform}, Docker环境: {IS_DOCKER}")
             return None, f"SMB连接错误: {str(e)} - 服务器: {server}\\{share}"
         finally:
-            # 恢复原始超时设置
-            socket.setdefaulttimeout(original_timeout)
-            
+            self._record_connect_result(server, established)
+
             # 更新网络健康状态
-            if time.time() - start_time < timeout * 0.5:
+            elapsed = time.monotonic() - start_time
+            if elapsed < timeout * 0.5:
                 # 快速连接表示网络状况良好
                 self._update_network_health(True)
-            elif time.time() - start_time > timeout * 0.8:
+            elif elapsed > timeout * 0.8:
                 # 接近超时表示网络状况较差
                 self._update_network_health(False)
             else:
                 # 中等时间表示网络状况一般
                 self._update_network_health(None)
 
+    def _check_fast_fail(self, server):
+        """服务器连续失败达到阈值且仍在冷却时间内时返回错误信息，否则返回None"""
+        with self._health_lock:
+            failures, last_failure = self._connect_failures.get(server, (0, 0.0))
+        if failures >= SMB_FAST_FAIL_THRESHOLD and time.monotonic() - last_failure < SMB_FAST_FAIL_COOLDOWN:
+            return f"快速失败: SMB服务器不可达（连续失败{failures}次）"
+        return None
+
+    def _record_connect_result(self, server, established):
+        """记录连接结果：成功时清除失败计数，失败时累加"""
+        with self._health_lock:
+            if established:
+                self._connect_failures.pop(server, None)
+            else:
+                failures, _ = self._connect_failures.get(server, (0, 0.0))
+                self._connect_failures[server] = (failures + 1, time.monotonic())
+
     def disconnect(self, server, share, user=None):
         """断开SMB连接"""
-        user = user or self.default_user
-        conn_key = f"{server}:{share}:{user}"
+        conn_key = self._conn_key(server, share, user)
         
         # 线程安全地断开连接
-        with self._lock:
-            if conn_key in self._connections:
+        shard_lock, connections = self._shard(server)
+        with shard_lock:
+            if conn_key in connections:
                 try:
-                    self._connections[conn_key].close()
-                    del self._connections[conn_key]
+                    connections.pop(conn_key).close()
                     logger.debug(f"[SMB] 已断开SMB连接: {server}\\{share}")
                 except Exception as e:
                     logger.warning(f"[SMB] 断开SMB连接时出错: {str(e)}")
 
     def is_connected(self, server, share, user=None):
-        """检查SMB连接是否活跃"""
-        user = user or self.default_user
-        conn_key = f"{server}:{share}:{user}"
-        
-        with self._lock:
-            if conn_key in self._connections:
-                try:
-                    return self._connections[conn_key].is_connected()
-                except:
-                    return False
-        return False
+        """检查SMB连接是否活跃
+
+        最近成功使用过的连接直接判定为活跃，只有缓存时间过期时才真正探测连接。
+        """
+        conn_key = self._conn_key(server, share, user)
+
+        shard_lock, connections = self._shard(server)
+        with shard_lock:
+            conn, last_ok = connections.get(conn_key)
+        if conn is None or getattr(conn, 'sock', None) is None:
+            return False
+        if time.monotonic() - last_ok < self.default_keepalive_interval * SMB_CONN_FRESH_RATIO:
+            return True
+        return _probe_connection(conn)
 
     def get_active_connections_count(self):
         """获取当前活跃的连接数量"""
-        with self._lock:
-            active = 0
-            for conn in self._connections.values():
-                try:
-                    if conn.is_connected():
-                        active += 1
-                except:
-                    pass
-            return active
+        fresh_window = self.default_keepalive_interval * SMB_CONN_FRESH_RATIO
+        active = 0
+        stale_conns = []
+        for shard_lock, connections in zip(self._shard_locks, self._shards):
+            with shard_lock:
+                fresh, stale = connections.split_by_freshness(fresh_window)
+            active += fresh
+            stale_conns.extend(stale)
+        # 最近成功过的连接直接计数，其余在释放分片锁后才调用is_connected()探测，
+        # 探测的网络I/O不会阻塞同一分片上的connect、_mark_ok和_invalidate
+        active += sum(1 for conn in stale_conns if _probe_connection(conn))
+        return active
     
     def _update_network_health(self, connection_success):
         """更新网络健康状态
@@ -222,47 +529,48 @@ class SMBManager:
         Args:
             connection_success: True表示连接良好，False表示连接较差，None表示一般
         """
-        with self._lock:
+        with self._health_lock:
             # 记录连接结果
-            current_time = time.time()
-            self.last_connection_attempts.append((current_time, connection_success))
-            
-            # 只保留最近的连接尝试记录
-            self.last_connection_attempts = [(t, s) for t, s in self.last_connection_attempts 
-                                           if current_time - t < 300]  # 只保留5分钟内的记录
+            current_time = time.monotonic()
+            attempts = self.last_connection_attempts
+            if len(attempts) == attempts.maxlen:
+                # 追加会挤掉最旧的记录，先扣除它的计数
+                evicted = attempts[0][1]
+                if evicted is True:
+                    self._health_success_count -= 1
+                elif evicted is False:
+                    self._health_failure_count -= 1
+            attempts.append((current_time, connection_success))
+            if connection_success is True:
+                self._health_success_count += 1
+            elif connection_success is False:
+                self._health_failure_count += 1
             
-            # 计算健康状态
-            if len(self.last_connection_attempts) > 0:
-                # 计算最近连接的成功率
-                success_count = sum(1 for t, s in self.last_connection_attempts if s is True)
-                failure_count = sum(1 for t, s in self.last_connection_attempts if s is False)
-                total = success_count + failure_count
-                
-                if total > 0:
-                    # 加权计算健康状态，近期的连接尝试权重更高
-                    weighted_sum = 0
-                    weight_sum = 0
-                    for t, s in sorted(self.last_connection_attempts, key=lambda x: x[0], reverse=True):
-                        age = current_time - t
-                        weight = max(0.1, 1 - age / 300)  # 5分钟内权重从1降到0.1
-                        if s is True:
-                            weighted_sum += weight
-                        elif s is False:
-                            weighted_sum += weight * 0.3  # 连接差的情况权重较低
-                        weight_sum += weight
-                    
-                    if weight_sum > 0:
-                        self.network_health = min(1.0, max(0.1, weighted_sum / weight_sum))
-                        
-                        # 动态调整默认超时值
-                        if self.network_health > 0.8:
-                            # 网络状况好，减少超时
-                            self.default_timeout = min(30, int(self.default_timeout * self.timeout_factor_low))
-                        elif self.network_health < 0.4:
-                            # 网络状况差，增加超时
-                            self.default_timeout = max(120, int(self.default_timeout * self.timeout_factor_high))
-                        
-                        logger.debug(f"[SMB] SMB网络健康状态更新: {self.network_health:.2f}, 超时设置: {self.default_timeout}秒")
+            # 按距上次更新的时间衰减已有权重，再加入本次结果
+            if self._health_last_update is not None:
+                decay = math.exp(-(current_time - self._health_last_update) / NETWORK_HEALTH_DECAY_SECONDS)
+                self._health_weight *= decay
+                self._health_weighted_sum *= decay
+            self._health_last_update = current_time
+            self._health_weight += 1.0
+            if connection_success is True:
+                self._health_weighted_sum += 1.0
+            elif connection_success is False:
+                self._health_weighted_sum += 0.3  # 连接差的情况权重较低
+
+            # 只有历史记录中出现过明确的好/差结果时才更新健康状态
+            if self._health_success_count + self._health_failure_count > 0:
+                self.network_health = min(1.0, max(0.1, self._health_weighted_sum / self._health_weight))
+
+                # 动态调整默认超时值
+                if self.network_health > 0.8:
+                    # 网络状况好，减少超时
+                    self.default_timeout = min(30, int(self.default_timeout * self.timeout_factor_low))
+                elif self.network_health < 0.4:
+                    # 网络状况差，增加超时
+                    self.default_timeout = max(120, int(self.default_timeout * self.timeout_factor_high))
+
+                logger.debug(f"[SMB] SMB网络健康状态更新: {self.network_health:.2f}, 超时设置: {self.default_timeout}秒")
     
     def get_adaptive_timeout(self, base_timeout=None):
         """获取根据网络状况调整的超时值
@@ -273,7 +581,7 @@ class SMBManager:
         Returns:
             int: 根据网络状况调整后的超时值
         """
-        with self._lock:
+        with self._health_lock:
             timeout = base_timeout or self.default_timeout
             # 根据网络健康状态调整超时
             if self.network_health > 0.8:
@@ -284,7 +592,6 @@ class SMBManager:
                 return min(180, int(timeout * self.timeout_factor_high))
             return timeout
 
-    @timeout(seconds=180, error_message="SMB文件列表获取超时")
     def list_files(self, server, share, path, user=None, password=None, domain=None, timeout=None):
         """列出SMB共享中的文件和目录
 
@@ -304,15 +611,16 @@ class SMBManager:
         adaptive_timeout = self.get_adaptive_timeout(timeout)
         # 连接超时设置为操作超时的一半
         connect_timeout = max(5, int(adaptive_timeout * 0.5))
+        # 整个操作（连接+SMB请求）的截止时间，由各socket操作的超时协同保证，无需额外的超时线程
+        deadline = time.monotonic() + connect_timeout + adaptive_timeout
         conn, err = self.connect(server, share, user, password, domain, connect_timeout)
         if err:
             return [], [], err
 
         try:
-            # 保存原始超时设置并设置新的超时
-            original_timeout = socket.getdefaulttimeout()
-            socket.setdefaulttimeout(adaptive_timeout)
-            
+            # 设置本连接socket的操作超时（截止时间前的剩余时间）
+            _apply_socket_timeout(conn, _remaining(deadline))
+
             # 规范化路径
             path = normalize_path_separator(path)
             
@@ -323,7 +631,7 @@ class SMBManager:
             # 列出目录内容
             file_list = []
             dir_list = []
-            for name, attrs in conn.listPath(share, path):
+            for name, attrs in conn.listPath(share, path, timeout=_remaining(deadline)):
                 if name in ('.', '..'):
                     continue
                 if attrs.isDirectory:
@@ -335,22 +643,23 @@ class SMBManager:
                         'mtime': attrs.last_write_time
                     })
 
+            self._mark_ok(server, share, user)
             return file_list, dir_list, None
 
         except socket.timeout:
+            self._invalidate(server, share, user)
             logger.error(f"[SMB] 列出SMB文件超时: {server}\\{share}{path}（{timeout}秒后）")
             return [], [], f"列出SMB文件超时: {server}\\{share}{path}（{timeout}秒后）"
         except socket.error as e:
+            self._invalidate(server, share, user)
             logger.error(f"[SMB] SMB网络错误: {str(e)} - 列出文件: {server}\\{share}{path}")
             return [], [], f"SMB网络错误: {str(e)} - 列出文件: {server}\\{share}{path}"
         except Exception as e:
+            if isinstance(e, _CONNECTION_ERRORS):
+                self._invalidate(server, share, user)
             logger.error(f"[SMB] 列出SMB文件时出错: {str(e)} - 路径: {server}\\{share}{path}")
             return [], [], f"列出SMB文件时出错: {str(e)} - 路径: {server}\\{share}{path}"
-        finally:
-            # 恢复原始超时设置
-            socket.setdefaulttimeout(original_timeout)
 
-    @timeout(seconds=120, error_message="SMB文件信息获取超时")
     def get_file_info(self, server, share, path, user=None, password=None, domain=None, timeout=None):
         """获取SMB文件的详细信息
 
@@ -370,15 +679,16 @@ class SMBManager:
         adaptive_timeout = self.get_adaptive_timeout(timeout)
         # 连接超时设置为操作超时的一半
         connect_timeout = max(5, int(adaptive_timeout * 0.5))
+        # 整个操作（连接+SMB请求）的截止时间，由各socket操作的超时协同保证，无需额外的超时线程
+        deadline = time.monotonic() + connect_timeout + adaptive_timeout
         conn, err = self.connect(server, share, user, password, domain, connect_timeout)
         if err:
             return None, err
 
         try:
-            # 保存原始超时设置并设置新的超时
-            original_timeout = socket.getdefaulttimeout()
-            socket.setdefaulttimeout(adaptive_timeout)
-            
+            # 设置本连接socket的操作超时（截止时间前的剩余时间）
+            _apply_socket_timeout(conn, _remaining(deadline))
+
             # 规范化路径
             path = normalize_path_separator(path)
             
@@ -391,31 +701,32 @@ class SMBManager:
                 dir_path += get_path_separator(dir_path)
 
             # 查找文件
-            for name, attrs in conn.listPath(share, dir_path):
-                if name == file_name:
-                    return {
-                        'name': name,
-                        'size': attrs.file_size,
-                        'mtime': attrs.last_write_time,
-                        'is_directory': attrs.isDirectory
-                    }, None
+            attrs = _find_entry(conn, share, dir_path, file_name, deadline)
+            self._mark_ok(server, share, user)
+            if attrs is not None:
+                return {
+                    'name': file_name,
+                    'size': attrs.file_size,
+                    'mtime': attrs.last_write_time,
+                    'is_directory': attrs.isDirectory
+                }, None
 
             return None, f"文件不存在: {path}"
 
         except socket.timeout:
+            self._invalidate(server, share, user)
             logger.error(f"[SMB] 获取SMB文件信息超时: {server}\\{share}{path}（{timeout}秒后）")
             return None, f"获取SMB文件信息超时: {server}\\{share}{path}（{timeout}秒后）"
         except socket.error as e:
+            self._invalidate(server, share, user)
             logger.error(f"[SMB] SMB网络错误: {str(e)} - 获取文件信息: {server}\\{share}{path}")
             return None, f"SMB网络错误: {str(e)} - 获取文件信息: {server}\\{share}{path}"
         except Exception as e:
+            if isinstance(e, _CONNECTION_ERRORS):
+                self._invalidate(server, share, user)
             logger.error(f"[SMB] 获取SMB文件信息时出错: {str(e)} - 路径: {server}\\{share}{path}")
             return None, f"获取SMB文件信息时出错: {str(e)} - 路径: {server}\\{share}{path}"
-        finally:
-            # 恢复原始超时设置
-            socket.setdefaulttimeout(original_timeout)
-            
-    @timeout(seconds=60, error_message="SMB路径检查超时")
+
     def path_exists(self, server, share, path, user=None, password=None, domain=None, timeout=None):
         """检查SMB路径是否存在
 
@@ -435,25 +746,29 @@ class SMBManager:
         adaptive_timeout = self.get_adaptive_timeout(timeout)
         # 连接超时设置为操作超时的一半
         connect_timeout = max(5, int(adaptive_timeout * 0.5))
+        # 整个操作（连接+SMB请求）的截止时间，由各socket操作的超时协同保证，无需额外的超时线程
+        deadline = time.monotonic() + connect_timeout + adaptive_timeout
         conn, err = self.connect(server, share, user, password, domain, connect_timeout)
         if err:
             return False, err
 
         try:
-            # 保存原始超时设置并设置新的超时
-            original_timeout = socket.getdefaulttimeout()
-            socket.setdefaulttimeout(adaptive_timeout)
-            
+            # 设置本连接socket的操作超时（截止时间前的剩余时间）
+            _apply_socket_timeout(conn, _remaining(deadline))
+
             # 规范化路径
             path = normalize_path_separator(path)
             
             # 处理根路径的特殊情况
-            if path in ('', '/', '\\'):
+            if path in _ROOT_PATHS:
                 # 对于根路径，尝试列出内容来验证其存在
                 try:
-                    conn.listPath(share, '/')
+                    conn.listPath(share, '/', timeout=_remaining(deadline))
+                    self._mark_ok(server, share, user)
                     return True, None
-                except:
+                except Exception as e:
+                    if isinstance(e, _CONNECTION_ERRORS):
+                        self._invalidate(server, share, user)
                     return False, f"无法访问根路径: {server}\{share}"
             
             # 解析路径为目录和文件名
@@ -464,31 +779,38 @@ class SMBManager:
             if dir_path and not dir_path.endswith(get_path_separator(dir_path)):
                 dir_path += get_path_separator(dir_path)
 
-            # 列出目录内容检查文件/目录是否存在
+            # 在目录中查找文件/目录是否存在
             try:
-                for name, attrs in conn.listPath(share, dir_path):
-                    if name == file_name:
-                        return True, None
+                attrs = _find_entry(conn, share, dir_path, file_name, deadline)
+                self._mark_ok(server, share, user)
+                if attrs is not None:
+                    return True, None
                 return False, f"路径不存在: {path}"
             except Exception as e:
+                if isinstance(e, _CONNECTION_ERRORS):
+                    self._invalidate(server, share, user)
                 return False, f"检查路径时出错: {str(e)} - {path}"
 
         except socket.timeout:
+            self._invalidate(server, share, user)
             logger.error(f"[SMB] SMB路径检查超时: {server}\\{share}{path}（{timeout}秒后）")
             return False, f"SMB路径检查超时: {server}\\{share}{path}（{timeout}秒后）"
         except socket.error as e:
+            self._invalidate(server, share, user)
             logger.error(f"[SMB] SMB网络错误: {str(e)} - 检查路径: {server}\\{share}{path}")
             return False, f"SMB网络错误: {str(e)} - 检查路径: {server}\\{share}{path}"
         except Exception as e:
+            if isinstance(e, _CONNECTION_ERRORS):
+                self._invalidate(server, share, user)
             logger.error(f"[SMB] 检查SMB路径时出错: {str(e)} - 路径: {server}\\{share}{path}")
             return False, f"检查SMB路径时出错: {str(e)} - 路径: {server}\\{share}{path}"
-        finally:
-            # 恢复原始超时设置
-            socket.setdefaulttimeout(original_timeout)
 
     def keep_alive(self, server, share, interval=None, user=None, password=None, domain=None, timeout=10):
         """保持SMB连接活跃
 
+        连接的socket已开启TCP保活，对端失效由内核检测；此方法仅作为可选的
+        SMB协议层保活，用于NAT等会回收空闲会话的网络路径。
+
         Args:
             server (str): SMB服务器地址
             share (str): 共享名称
@@ -499,7 +821,7 @@ class SMBManager:
             timeout (int): 保持活跃操作的超时时间（秒），默认为10秒
 
         Returns:
-            threading.Thread: 后台线程对象
+            threading.Thread: 后台线程对象，调用其stop()方法可停止保活
         """
         # 使用环境相关的默认间隔
         interval = interval or self.default_keepalive_interval
@@ -507,59 +829,35 @@ class SMBManager:
         def _keep_alive():
             attempt = 0
             max_attempts = 3  # 连续失败后的连接尝试次数
-            
-            while True:
+            # 跨轮次持有的连接，只在保活操作失败后才重新获取
+            conn = None
+
+            def _keep_alive_operation():
+                # 设置本连接socket的保活操作超时
+                _apply_socket_timeout(conn, timeout)
+
+                # 直接在已持有的连接上发送SMB echo；不支持echo时退回列出根目录
                 try:
-                    # 记录当前连接状态
-                    conn_status = self.is_connected(server, share, user)
-                    logger.debug(f"[SMB] 保活检查 - 当前连接状态: {conn_status} - {server}\\{share}")
-                    
-                    # 使用较短的超时时间进行保活操作
-                    conn, err = self.connect(server, share, user, password, domain, timeout)
+                    conn.echo(_KEEPALIVE_ECHO_DATA, timeout=timeout)
+                except (AttributeError, NotImplementedError):
+                    conn.listPath(share, normalize_path_separator('/'), timeout=timeout)
+                self._mark_ok(server, share, user)
+
+                # 在Docker环境中记录连接状态
+                if IS_DOCKER:
+                    logger.debug(f"[SMB] SMB连接保持活跃: {server}\\{share} - 活跃连接数: {self.get_active_connections_count()}")
+
+            while not stop_event.is_set():
+                try:
+                    err = None
+                    if conn is None:
+                        # 使用较短的超时时间建立连接
+                        conn, err = self.connect(server, share, user, password, domain, timeout)
                     if conn:
                         # 重置尝试计数
                         attempt = 0
-                        
-                        # 执行简单操作以保持连接活跃
-                        try:
-                            # 使用超时装饰器提供的函数执行带超时的操作
-                            def _keep_alive_operation():
-                                # 保存原始超时设置并设置新的超时
-                                original_timeout = socket.getdefaulttimeout()
-                                socket.setdefaulttimeout(timeout)
-                                
-                                try:
-                                    # 规范化路径
-                                    test_path = normalize_path_separator('/')
-                                    conn.listPath(share, test_path)
-                                    
-                                    # 在Docker环境中记录连接状态
-                                    if IS_DOCKER:
-                                        logger.debug(f"[SMB] SMB连接保持活跃: {server}\\{share} - 活跃连接数: {self.get_active_connections_count()}")
-                                finally:
-                                    # 恢复原始超时设置
-                                    socket.setdefaulttimeout(original_timeout)
-                            
-                            # 执行带超时的保活操作
-                            run_with_timeout(
-                                _keep_alive_operation,
-                                timeout_seconds=timeout,
-                                default=False,
-                                error_message=f"SMB保活操作超时: {server}\{share}"
-                            )
-                        except Exception as e:
-                            logger.warning(f"[SMB] SMB保活操作失败: {str(e)} - {server}\\{share}")
-                            # 在Docker环境中更频繁地重连
-                            if IS_DOCKER:
-                                logger.warning(f"[SMB] Docker环境下SMB连接异常，尝试重建连接...")
-                                with self._lock:
-                                    conn_key = f"{server}:{share}:{user or self.default_user}"
-                                    if conn_key in self._connections:
-                                        try:
-                                            self._connections[conn_key].close()
-                                            del self._connections[conn_key]
-                                        except:
-                                            pass
+                        # 保活操作直接在持有的连接上执行，超时由socket超时和echo的timeout参数限制
+                        _keep_alive_operation()
                     elif err:
                         attempt += 1
                         logger.warning(f"[SMB] SMB保活连接失败 ({attempt}/{max_attempts}): {err}")
@@ -567,21 +865,24 @@ class SMBManager:
                         # 如果连续多次失败，可能需要更积极的重连策略
                         if attempt >= max_attempts and IS_DOCKER:
                             logger.warning(f"[SMB] Docker环境下连续{max_attempts}次SMB保活失败，清理所有连接并重建...")
-                            with self._lock:
-                                # 清理所有与该服务器相关的连接
+                            shard_lock, connections = self._shard(server)
+                            with shard_lock:
+                                # 清理所有与该服务器相关的连接（同一服务器的连接都在同一分片中）
                                 keys_to_remove = []
-                                for key in self._connections:
-                                    if key.startswith(f"{server}:"):
+                                for key in connections.keys:
+                                    if key[0] == server:
                                         keys_to_remove.append(key)
                                 for key in keys_to_remove:
                                     try:
-                                        self._connections[key].close()
-                                        del self._connections[key]
+                                        connections.pop(key).close()
                                     except:
                                         pass
                             attempt = 0  # 重置尝试计数
                 except Exception as e:
                     logger.warning(f"[SMB] SMB连接保持失败: {str(e)} - {server}\\{share}")
+                    # 放弃持有的连接并将其移出连接池，下一轮重新建立连接，不会再从连接池取回失效的连接
+                    conn = None
+                    self._invalidate(server, share, user)
                 
                 # 根据环境调整休眠时间
                 sleep_time = interval
@@ -590,9 +891,13 @@ class SMBManager:
                     sleep_time = min(interval * (2 ** (attempt - 1)), 300)  # 最多5分钟
                 
                 logger.debug(f"[SMB] SMB保活线程休眠: {sleep_time}秒 - {server}\\{share}")
-                time.sleep(sleep_time)
+                if stop_event.wait(sleep_time):
+                    break
 
+        # 停止事件：调用thread.stop()后保活线程在当前休眠结束前退出
+        stop_event = threading.Event()
         thread = threading.Thread(target=_keep_alive, daemon=True, name=f"SMB-KeepAlive-{server}-{share}")
+        thread.stop = stop_event.set
         thread.start()
         logger.info(f"[SMB] 已启动SMB连接保持线程: {server}\\{share}（间隔: {interval}秒）")
         return thread
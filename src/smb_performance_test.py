@@ -10,11 +10,43 @@ import time
 import logging
 import json
 import statistics
+import threading
+import contextlib
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from .smb_api import SMBManager
+from . import snapshot_utils
 from .snapshot_utils import generate_snapshot
 
+# 可选依赖：gil_load用于测量GIL争用，未安装时跳过该指标
+try:
+    import gil_load
+except ImportError:
+    gil_load = None
+
+# 可选依赖：orjson在C中完成序列化，未安装时使用标准库json
+try:
+    import orjson
+
+    def _dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+
+    def _dumps_compact(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    def _dumps_line(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
+    def _dumps_compact(obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def _dumps_line(obj):
+        return (json.dumps(obj, ensure_ascii=False) + '\n').encode('utf-8')
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -23,40 +55,170 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# CPU利用率（CPU时间/墙钟时间）达到此值时认为扫描受GIL限制
+GIL_BOUND_CPU_UTILIZATION = 0.9
+
+# GIL争用比例超过此值时建议改用多进程或无GIL的Python
+GIL_CONTENTION_THRESHOLD = 0.4
+
+def _best_by(records, key_name):
+    """返回records中key_name值最大的记录（itemgetter在C中取值，不经过lambda调用）"""
+    return max(records, key=itemgetter(key_name))
+
+def _temp_snapshot_dir():
+    """临时快照文件目录：优先使用内存文件系统（/dev/shm），快照写入不产生磁盘块分配，
+    计时只反映SMB扫描本身"""
+    shm_dir = '/dev/shm'
+    if os.path.isdir(shm_dir) and os.access(shm_dir, os.W_OK):
+        return shm_dir
+    return '/tmp'
+
+# 计时扫描固定运行的最少CPU数量，避免线程在所有CPU（及NUMA节点）之间迁移造成测量噪声；
+# 扫描线程数更多时按线程数固定，不限制被测的并发度
+PINNED_CPU_COUNT = 4
+
+@contextlib.contextmanager
+def _pinned_cpu_affinity(cpu_count):
+    """计时扫描期间把当前线程（及其创建的扫描线程）固定到可用CPU中的前cpu_count个，
+    退出时恢复原来的CPU亲和性（仅Linux，失败时忽略）"""
+    original = None
+    if hasattr(os, 'sched_setaffinity'):
+        try:
+            original = os.sched_getaffinity(0)
+            cpus = sorted(original)[:cpu_count]
+            os.sched_setaffinity(0, cpus)
+            logger.debug(f"已固定CPU亲和性: {cpus}")
+        except OSError as e:
+            original = None
+            logger.debug(f"设置CPU亲和性失败: {str(e)}")
+    try:
+        yield
+    finally:
+        if original is not None:
+            try:
+                os.sched_setaffinity(0, original)
+            except OSError as e:
+                logger.debug(f"恢复CPU亲和性失败: {str(e)}")
+
+def _read_ctx_switches():
+    """读取本进程的主动/被动上下文切换次数（仅Linux），不可用时返回None"""
+    try:
+        with open('/proc/self/status') as f:
+            status = f.read()
+    except OSError:
+        return None
+    counts = {}
+    for line in status.splitlines():
+        if line.startswith(('voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches')):
+            name, value = line.split(':', 1)
+            counts[name] = int(value)
+    if len(counts) != 2:
+        return None
+    return counts['voluntary_ctxt_switches'], counts['nonvoluntary_ctxt_switches']
+
+# 所有测试中同时进行的扫描数上限，避免并行测试对同一服务器造成过多并发请求
+_SCAN_SEMAPHORE = threading.BoundedSemaphore(16)
+
 class SMBPerformanceTester:
-    def __init__(self):
+    def __init__(self, parallel_iterations=False):
         self.smb_manager = SMBManager()
-        self.results = []
+        # 迭代次数大于2时是否并行运行各次迭代（并行时各次扫描会相互竞争，CPU利用率按进程统计）
+        self.parallel_iterations = parallel_iterations
+        # 每条结果产生时立即追加写入JSON Lines文件，不在内存中保留，测试中断时已完成的结果也不会丢失；
+        # 文件在第一条结果产生时才创建，无缓冲的追加写入每条结果只调用一次write，多个测试线程同时写入也不会交错
+        self.stream_file = f"/tmp/smb_perf_stream_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        self._sink = None
+        self._sink_lock = threading.Lock()
+        # 各测试路径的文件列表缓存，避免扫描参数测试点之间重复遍历目录
+        self._dir_cache = {}
+        # 连接保持工作线程在各测试间隔之间复用，每轮读取当前间隔
+        self._keep_alive_interval = 60.0
+        self._keep_alive_path = None
+        self._keep_alive_stop = threading.Event()
+        self._keep_alive_thread = None
+        
+        # gil_load同一时间只能测量一个扫描，并行测试时其余扫描跳过该指标
+        self._gil_lock = threading.Lock()
+        
+        # gil_load必须在其他线程启动前初始化
+        if gil_load is not None:
+            gil_load.init()
         
     def print_separator(self):
         print("=" * 80)
     
-    def test_scan_speed(self, path, iterations=3):
-        """测试SMB路径的扫描速度
+    @staticmethod
+    def _unlink_all(temp_paths):
+        """删除测试产生的临时快照文件，不存在的文件直接忽略"""
+        for temp_path in temp_paths:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.debug(f"删除临时快照文件失败: {temp_path} - {str(e)}")
+    
+    def _keep_alive_worker(self):
+        """定期访问测试路径以保持连接活跃，间隔每轮重新读取"""
+        while True:
+            try:
+                os.listdir(self._keep_alive_path)
+            except OSError as e:
+                logger.debug(f"连接保持访问失败: {self._keep_alive_path} - {str(e)}")
+            if self._keep_alive_stop.wait(self._keep_alive_interval):
+                break
+    
+    def _start_keep_alive(self, path, interval):
+        """设置连接保持的路径和间隔，工作线程未运行时启动它"""
+        self._keep_alive_path = path
+        self._keep_alive_interval = float(interval)
+        if self._keep_alive_thread is None or not self._keep_alive_thread.is_alive():
+            self._keep_alive_stop.clear()
+            self._keep_alive_thread = threading.Thread(target=self._keep_alive_worker, daemon=True)
+            self._keep_alive_thread.start()
+    
+    def _stop_keep_alive(self):
+        """停止连接保持工作线程"""
+        if self._keep_alive_thread is not None:
+            self._keep_alive_stop.set()
+            self._keep_alive_thread.join()
+            self._keep_alive_thread = None
+    
+    def _warm_cache(self, path):
+        """遍历一次测试路径并缓存文件列表
         
         Args:
             path (str): 要扫描的SMB路径
-            iterations (int): 测试迭代次数
         
         Returns:
-            dict: 扫描性能结果
+            list: 文件路径列表
         """
-        self.print_separator()
-        logger.info(f"测试SMB路径扫描速度: {path}")
-        logger.info(f"迭代次数: {iterations}")
+        if path not in self._dir_cache:
+            logger.info(f"缓存目录文件列表: {path}")
+            self._dir_cache[path] = [os.path.join(root, name) for root, _, files in os.walk(path) for name in files]
+            logger.info(f"已缓存 {len(self._dir_cache[path])} 个文件")
+        return self._dir_cache[path]
+    
+    def _run_scan_iteration(self, path, temp_snapshot_path, file_list=None, snapshot_options=None):
+        """执行一次扫描并计时
         
-        scan_times = []
-        file_counts = []
-        error_counts = []
+        Args:
+            path (str): 要扫描的SMB路径
+            temp_snapshot_path (str): 临时快照文件路径
+            file_list (list, optional): 预先收集的文件路径列表
+            snapshot_options (dict, optional): 传给generate_snapshot的扫描参数（max_workers、batch_size等）
         
-        for i in range(iterations):
-            logger.info(f"=== 迭代 {i+1}/{iterations} ===")
-            
-            # 创建临时快照文件
-            temp_snapshot_path = f"/tmp/smb_perf_test_{int(time.time())}_{i}.snapshot"
-            
-            # 记录开始时间
-            start_time = time.time()
+        Returns:
+            tuple: (扫描时间, CPU时间, GIL争用或None, 上下文切换次数或None, 文件数量)，扫描失败时返回None
+        """
+        with _SCAN_SEMAPHORE:
+            ctx_start = _read_ctx_switches()
+            # 记录开始时间（单调高精度时钟和本进程CPU时间，纳秒）
+            start_ns = time.perf_counter_ns()
+            cpu_start_ns = time.process_time_ns()
+            measure_gil = gil_load is not None and self._gil_lock.acquire(blocking=False)
+            if measure_gil:
+                gil_load.start(output=None, output_interval=0.1)
             
             try:
                 # 执行扫描
@@ -68,61 +230,138 @@ class SMBPerformanceTester:
                     skip_large=False,
                     large_threshold=10000,
                     min_size=0,
-                    min_size_mb=0  # 不过滤小文件
+                    min_size_mb=0,  # 不过滤小文件
+                    file_list=file_list,
+                    **(snapshot_options or {})
                 )
                 
                 # 记录结束时间
-                end_time = time.time()
-                scan_time = end_time - start_time
-                
-                scan_times.append(scan_time)
-                file_counts.append(file_count)
-                error_counts.append(0)  # 假设没有错误
+                scan_time = (time.perf_counter_ns() - start_ns) * 1e-9
+                cpu_time = (time.process_time_ns() - cpu_start_ns) * 1e-9
+                gil_contention = None
+                if measure_gil:
+                    gil_load.stop()
+                    self._gil_lock.release()
+                    gil_contention = gil_load.get(4)[0]
+                ctx_end = _read_ctx_switches()
+                ctx_switches = None
+                if ctx_start is not None and ctx_end is not None:
+                    ctx_switches = (ctx_end[0] - ctx_start[0], ctx_end[1] - ctx_start[1])
                 
-                logger.info(f"扫描完成，耗时: {scan_time:.2f}秒")
-                logger.info(f"找到文件数量: {file_count}")
-                logger.info(f"每秒处理文件数: {file_count/scan_time:.2f}文件/秒")
+                logger.info("扫描完成，耗时: %.2f秒", scan_time)
+                logger.info("找到文件数量: %s", file_count)
+                logger.info("每秒处理文件数: %.2f文件/秒", file_count / scan_time if scan_time > 0 else 0)
+                return scan_time, cpu_time, gil_contention, ctx_switches, file_count
                 
             except Exception as e:
-                logger.error(f"扫描失败: {str(e)}")
+                if measure_gil:
+                    gil_load.stop()
+                    self._gil_lock.release()
+                logger.error("扫描失败: %s", e)
+                return None
+    
+    def test_scan_speed(self, path, iterations=3, use_cached_listing=False, **snapshot_options):
+        """测试SMB路径的扫描速度
+        
+        Args:
+            path (str): 要扫描的SMB路径
+            iterations (int): 测试迭代次数
+            use_cached_listing (bool): 是否使用缓存的文件列表，只测量文件处理阶段
+            **snapshot_options: 传给generate_snapshot的扫描参数（max_workers、batch_size、keep_alive_interval）
+        
+        Returns:
+            dict: 扫描性能结果
+        """
+        self.print_separator()
+        logger.info(f"测试SMB路径扫描速度: {path}")
+        logger.info(f"迭代次数: {iterations}")
+        
+        scan_times = []
+        cpu_times = []
+        gil_contentions = []
+        ctx_switches = []
+        file_counts = []
+        error_counts = []
+        
+        file_list = self._warm_cache(path) if use_cached_listing else None
+        # 固定的CPU数不少于扫描线程数，并行迭代时按同时运行的扫描数相应增加
+        concurrent_scans = min(iterations, 4) if self.parallel_iterations and iterations > 2 else 1
+        pinned_cpu_count = max(PINNED_CPU_COUNT, (snapshot_options.get('max_workers') or 0) * concurrent_scans)
+        
+        # 临时快照文件名前缀只生成一次；带上线程标识，避免并行测试时文件名冲突
+        temp_snapshot_prefix = os.path.join(_temp_snapshot_dir(), f"smb_perf_test_{int(time.time())}_{threading.get_ident()}")
+        temp_snapshot_paths = [f"{temp_snapshot_prefix}_{i}.snapshot" for i in range(iterations)]
+        
+        def _run(i):
+            logger.info("=== 迭代 %d/%d ===", i + 1, iterations)
+            return self._run_scan_iteration(path, temp_snapshot_paths[i], file_list, snapshot_options)
+        
+        # 多次迭代彼此独立，启用并行时同时运行，否则依次运行；CPU亲和性只在计时扫描期间固定
+        with _pinned_cpu_affinity(pinned_cpu_count):
+            if concurrent_scans > 1:
+                with ThreadPoolExecutor(max_workers=concurrent_scans) as pool:
+                    outcomes = list(pool.map(_run, range(iterations)))
+            else:
+                outcomes = [_run(i) for i in range(iterations)]
+        
+        for outcome in outcomes:
+            if outcome is None:
                 error_counts.append(1)
                 continue
-            finally:
-                # 清理临时文件
-                if os.path.exists(temp_snapshot_path):
-                    try:
-                        os.remove(temp_snapshot_path)
-                    except:
-                        pass
-        
-        # 计算统计数据
+            scan_time, cpu_time, gil_contention, ctx_switch, file_count = outcome
+            scan_times.append(scan_time)
+            cpu_times.append(cpu_time)
+            if gil_contention is not None:
+                gil_contentions.append(gil_contention)
+            if ctx_switch is not None:
+                ctx_switches.append(ctx_switch)
+            file_counts.append(file_count)
+            error_counts.append(0)  # 假设没有错误
+        
+        # 临时文件在所有迭代结束后统一清理，不占用计时区间
+        self._unlink_all(temp_snapshot_paths)
+        
+        # 计算统计数据（fmean以浮点直接求和，不经过statistics.mean的精确分数运算）
         if scan_times:
+            avg_scan_time = statistics.fmean(scan_times)
             result = {
                 'test': 'scan_speed',
                 'path': path,
                 'iterations': iterations,
-                'avg_scan_time': statistics.mean(scan_times) if scan_times else 0,
-                'min_scan_time': min(scan_times) if scan_times else 0,
-                'max_scan_time': max(scan_times) if scan_times else 0,
-                'std_dev_scan_time': statistics.stdev(scan_times) if len(scan_times) > 1 else 0,
-                'avg_file_count': statistics.mean(file_counts) if file_counts else 0,
-                'avg_files_per_second': statistics.mean([fc/st if st > 0 else 0 for fc, st in zip(file_counts, scan_times)]) if scan_times else 0,
+                'avg_scan_time': avg_scan_time,
+                'min_scan_time': min(scan_times),
+                'max_scan_time': max(scan_times),
+                'std_dev_scan_time': statistics.stdev(scan_times, avg_scan_time) if len(scan_times) > 1 else 0,
+                'avg_file_count': statistics.fmean(file_counts),
+                'avg_files_per_second': statistics.fmean([fc/st if st > 0 else 0 for fc, st in zip(file_counts, scan_times)]),
+                # CPU时间与墙钟时间之比：接近1表示单核跑满（受GIL限制），远小于1表示主要在等待I/O
+                'avg_cpu_time': statistics.fmean(cpu_times),
+                'cpu_utilization': statistics.fmean([ct/st if st > 0 else 0 for ct, st in zip(cpu_times, scan_times)]),
+                # GIL被持有的时间比例，未安装gil_load时为None
+                'gil_contention': statistics.fmean(gil_contentions) if gil_contentions else None,
+                # 每次扫描期间的主动（等待I/O）/被动（被抢占）上下文切换次数，非Linux时为None
+                'ctx_switches_vol': statistics.fmean([c[0] for c in ctx_switches]) if ctx_switches else None,
+                'ctx_switches_invol': statistics.fmean([c[1] for c in ctx_switches]) if ctx_switches else None,
                 'error_count': sum(error_counts),
                 'timestamp': datetime.now().isoformat()
             }
             
-            self.results.append(result)
+            self._record_result(result)
             
             # 打印汇总信息
-            self.print_separator()
-            logger.info("扫描速度测试汇总:")
-            logger.info(f"平均扫描时间: {result['avg_scan_time']:.2f}秒")
-            logger.info(f"最小扫描时间: {result['min_scan_time']:.2f}秒")
-            logger.info(f"最大扫描时间: {result['max_scan_time']:.2f}秒")
-            logger.info(f"扫描时间标准差: {result['std_dev_scan_time']:.2f}秒")
-            logger.info(f"平均文件数量: {result['avg_file_count']:.0f}")
-            logger.info(f"平均每秒处理文件数: {result['avg_files_per_second']:.2f}文件/秒")
-            logger.info(f"错误次数: {result['error_count']}")
+            if logger.isEnabledFor(logging.INFO):
+                self.print_separator()
+                logger.info("扫描速度测试汇总:")
+                logger.info(f"平均扫描时间: {result['avg_scan_time']:.2f}秒")
+                logger.info(f"最小扫描时间: {result['min_scan_time']:.2f}秒")
+                logger.info(f"最大扫描时间: {result['max_scan_time']:.2f}秒")
+                logger.info(f"扫描时间标准差: {result['std_dev_scan_time']:.2f}秒")
+                logger.info(f"平均文件数量: {result['avg_file_count']:.0f}")
+                logger.info(f"平均每秒处理文件数: {result['avg_files_per_second']:.2f}文件/秒")
+                logger.info(f"CPU利用率: {result['cpu_utilization']:.2f}")
+                if result['gil_contention'] is not None:
+                    logger.info(f"GIL争用: {result['gil_contention']:.2f}")
+                logger.info(f"错误次数: {result['error_count']}")
             
             return result
         else:
@@ -146,29 +385,23 @@ class SMBPerformanceTester:
         
         thread_results = []
         
-        for thread_size in thread_sizes:
+        def _run(thread_size):
             logger.info(f"=== 测试线程池大小: {thread_size} ===")
-            
-            # 保存原始线程池大小
-            original_max_workers = os.environ.get('SMB_MAX_WORKERS')
-            
-            try:
-                # 设置新的线程池大小
-                os.environ['SMB_MAX_WORKERS'] = str(thread_size)
-                logger.info(f"已设置SMB_MAX_WORKERS={thread_size}")
-                
-                # 运行扫描测试
-                result = self.test_scan_speed(path, iterations=iterations)
-                if result:
-                    result['thread_size'] = thread_size
-                    thread_results.append(result)
-            finally:
-                # 恢复原始线程池大小
-                if original_max_workers is not None:
-                    os.environ['SMB_MAX_WORKERS'] = original_max_workers
-                else:
-                    if 'SMB_MAX_WORKERS' in os.environ:
-                        del os.environ['SMB_MAX_WORKERS']
+            # 线程池大小作为参数直接传给generate_snapshot，不修改环境变量
+            result = self.test_scan_speed(path, iterations=iterations, max_workers=thread_size)
+            if result:
+                result['thread_size'] = thread_size
+            return result
+        
+        # 各测试点同时运行时扫描相互竞争，测得的性能不能用于比较线程池大小，
+        # 因此与多次迭代一样只在启用并行时（--parallel）才并行，且只在无GIL的CPython（3.13t）上
+        if self.parallel_iterations and not getattr(sys, '_is_gil_enabled', lambda: True)():
+            logger.info("已启用并行且检测到无GIL的Python，并行运行各线程池大小测试点（结果会相互影响）")
+            with ThreadPoolExecutor(max_workers=len(thread_sizes)) as pool:
+                outcomes = list(pool.map(_run, thread_sizes))
+        else:
+            outcomes = [_run(thread_size) for thread_size in thread_sizes]
+        thread_results = [result for result in outcomes if result]
         
         # 分析线程池大小对性能的影响
         if thread_results:
@@ -176,79 +409,82 @@ class SMBPerformanceTester:
             logger.info("线程池大小测试汇总:")
             
             # 按线程池大小排序
-            thread_results.sort(key=lambda x: x['thread_size'])
+            thread_results.sort(key=itemgetter('thread_size'))
             
             for result in thread_results:
-                logger.info(f"线程池大小: {result['thread_size']}, 平均扫描时间: {result['avg_scan_time']:.2f}秒, 平均每秒处理文件数: {result['avg_files_per_second']:.2f}文件/秒")
+                logger.info(f"线程池大小: {result['thread_size']}, 平均扫描时间: {result['avg_scan_time']:.2f}秒, 平均每秒处理文件数: {result['avg_files_per_second']:.2f}文件/秒, CPU利用率: {result['cpu_utilization']:.2f}")
             
             # 找出最佳线程池大小
-            best_result = max(thread_results, key=lambda x: x['avg_files_per_second'])
+            best_result = _best_by(thread_results, 'avg_files_per_second')
             logger.info(f"最佳线程池大小: {best_result['thread_size']}, 性能: {best_result['avg_files_per_second']:.2f}文件/秒")
+            if best_result['cpu_utilization'] >= GIL_BOUND_CPU_UTILIZATION:
+                logger.info("扫描已接近单核满载，受GIL限制，增加线程数不会继续提升性能")
             
         return thread_results
     
-    def test_batch_size(self, path, batch_sizes=[100, 250, 500, 1000], iterations=2):
-        """测试不同批处理大小对SMB扫描性能的影响
+    def test_batch_size(self, path, batch_sizes=[100, 250, 500, 1000], iterations=2, outstanding_ops=[4, 8, 16, 32, 64]):
+        """测试不同批处理大小和同时进行中操作数对SMB扫描性能的影响
         
         Args:
             path (str): 要扫描的SMB路径
             batch_sizes (list): 要测试的批处理大小列表
-            iterations (int): 每个批处理大小的测试迭代次数
+            iterations (int): 每个组合的测试迭代次数
+            outstanding_ops (list): 要测试的同时进行中操作数上限（SMB_MAX_INFLIGHT）列表
         
         Returns:
-            list: 不同批处理大小的性能结果
+            list: 不同批处理大小和同时进行中操作数的性能结果
         """
         self.print_separator()
         logger.info(f"测试不同批处理大小对SMB扫描的影响: {path}")
         logger.info(f"要测试的批处理大小: {batch_sizes}")
-        
-        import importlib
-        importlib.reload(sys.modules.get('src.snapshot_utils'))
-        from src.snapshot_utils import generate_snapshot
+        logger.info(f"要测试的同时进行中操作数: {outstanding_ops}")
         
         batch_results = []
-        original_batch_size = None
+        # 保存原始设置；直接修改已加载模块的设置，不重新加载模块，已建立的SMB连接在各测试点之间保持可用
+        original_inflight = snapshot_utils.SMB_MAX_INFLIGHT
         
         try:
-            # 保存原始批处理大小
-            if hasattr(sys.modules.get('src.snapshot_utils'), 'SMB_BATCH_SIZE'):
-                original_batch_size = sys.modules.get('src.snapshot_utils').SMB_BATCH_SIZE
-            
             for batch_size in batch_sizes:
                 logger.info(f"=== 测试批处理大小: {batch_size} ===")
                 
-                # 设置新的批处理大小
-                if hasattr(sys.modules.get('src.snapshot_utils'), 'SMB_BATCH_SIZE'):
-                    setattr(sys.modules.get('src.snapshot_utils'), 'SMB_BATCH_SIZE', batch_size)
-                    logger.info(f"已设置批处理大小={batch_size}")
-                else:
-                    logger.warning("无法修改批处理大小，跳过此测试")
-                    continue
-                
-                # 运行扫描测试
-                result = self.test_scan_speed(path, iterations=iterations)
-                if result:
-                    result['batch_size'] = batch_size
-                    batch_results.append(result)
+                for outstanding in outstanding_ops:
+                    # 设置同时进行中操作数上限
+                    snapshot_utils.SMB_MAX_INFLIGHT = outstanding
+                    logger.info(f"已设置同时进行中操作数={outstanding}")
+                    
+                    # 运行扫描测试；批处理大小只影响文件处理阶段，复用缓存的文件列表
+                    result = self.test_scan_speed(path, iterations=iterations, use_cached_listing=True, batch_size=batch_size)
+                    if result:
+                        result['batch_size'] = batch_size
+                        result['outstanding'] = outstanding
+                        batch_results.append(result)
         finally:
-            # 恢复原始批处理大小
-            if original_batch_size is not None and hasattr(sys.modules.get('src.snapshot_utils'), 'SMB_BATCH_SIZE'):
-                setattr(sys.modules.get('src.snapshot_utils'), 'SMB_BATCH_SIZE', original_batch_size)
+            # 恢复原始设置
+            snapshot_utils.SMB_MAX_INFLIGHT = original_inflight
         
         # 分析批处理大小对性能的影响
         if batch_results:
             self.print_separator()
             logger.info("批处理大小测试汇总:")
             
-            # 按批处理大小排序
-            batch_results.sort(key=lambda x: x['batch_size'])
+            # 按批处理大小和同时进行中操作数排序
+            batch_results.sort(key=itemgetter('batch_size', 'outstanding'))
             
             for result in batch_results:
-                logger.info(f"批处理大小: {result['batch_size']}, 平均扫描时间: {result['avg_scan_time']:.2f}秒, 平均每秒处理文件数: {result['avg_files_per_second']:.2f}文件/秒")
+                logger.info(f"批处理大小: {result['batch_size']}, 同时进行中操作数: {result['outstanding']}, 平均扫描时间: {result['avg_scan_time']:.2f}秒, 平均每秒处理文件数: {result['avg_files_per_second']:.2f}文件/秒")
+            
+            # 以热力图形式输出：行为批处理大小，列为同时进行中操作数，单元格为每秒处理文件数
+            columns = sorted({r['outstanding'] for r in batch_results})
+            cells = {(r['batch_size'], r['outstanding']): r['avg_files_per_second'] for r in batch_results}
+            logger.info("每秒处理文件数（行：批处理大小，列：同时进行中操作数）:")
+            logger.info("".join(f"{c:>10}" for c in ['batch'] + columns))
+            for batch_size in sorted({r['batch_size'] for r in batch_results}):
+                row = [f"{cells[(batch_size, c)]:.2f}" if (batch_size, c) in cells else '-' for c in columns]
+                logger.info("".join(f"{v:>10}" for v in [batch_size] + row))
             
-            # 找出最佳批处理大小
-            best_result = max(batch_results, key=lambda x: x['avg_files_per_second'])
-            logger.info(f"最佳批处理大小: {best_result['batch_size']}, 性能: {best_result['avg_files_per_second']:.2f}文件/秒")
+            # 找出最佳组合
+            best_result = _best_by(batch_results, 'avg_files_per_second')
+            logger.info(f"最佳批处理大小: {best_result['batch_size']}, 最佳同时进行中操作数: {best_result['outstanding']}, 性能: {best_result['avg_files_per_second']:.2f}文件/秒")
             
         return batch_results
     
@@ -258,7 +494,7 @@ class SMBPerformanceTester:
         Args:
             path (str): 要扫描的SMB路径
             intervals (list): 要测试的连接保持间隔（秒）
-            duration (int): 测试持续时间（秒）
+            duration (int): 保留以兼容旧调用；扫描本身已覆盖连接保持期间，不再额外等待
             iterations (int): 每个间隔的测试迭代次数
         
         Returns:
@@ -273,37 +509,15 @@ class SMBPerformanceTester:
         for interval in intervals:
             logger.info(f"=== 测试连接保持间隔: {interval}秒 ===")
             
-            # 保存原始连接保持间隔
-            original_interval = None
-            if hasattr(self.smb_manager, 'keep_alive_interval'):
-                original_interval = self.smb_manager.keep_alive_interval
+            # 复用同一个连接保持线程，只更新其间隔
+            logger.info(f"连接保持间隔切换为{interval}秒")
+            self._start_keep_alive(path, interval)
             
-            try:
-                # 设置新的连接保持间隔
-                if hasattr(self.smb_manager, 'keep_alive_interval'):
-                    setattr(self.smb_manager, 'keep_alive_interval', interval)
-                    logger.info(f"已设置连接保持间隔={interval}秒")
-                
-                # 启动连接保持
-                logger.info(f"启动连接保持，持续{duration}秒")
-                thread = self.smb_manager.keep_connection_alive(path, interval=interval)
-                
-                # 等待连接建立
-                time.sleep(2)
-                
-                # 运行扫描测试
-                result = self.test_scan_speed(path, iterations=iterations)
-                if result:
-                    result['keep_alive_interval'] = interval
-                    keep_alive_results.append(result)
-                
-                # 等待连接保持测试完成
-                time.sleep(duration)
-                
-            finally:
-                # 恢复原始连接保持间隔
-                if original_interval is not None and hasattr(self.smb_manager, 'keep_alive_interval'):
-                    setattr(self.smb_manager, 'keep_alive_interval', original_interval)
+            # 运行扫描测试；扫描内部的连接保持也使用相同间隔
+            result = self.test_scan_speed(path, iterations=iterations, keep_alive_interval=interval)
+            if result:
+                result['keep_alive_interval'] = interval
+                keep_alive_results.append(result)
         
         # 分析连接保持间隔对性能的影响
         if keep_alive_results:
@@ -311,27 +525,55 @@ class SMBPerformanceTester:
             logger.info("连接保持间隔测试汇总:")
             
             # 按连接保持间隔排序
-            keep_alive_results.sort(key=lambda x: x['keep_alive_interval'])
+            keep_alive_results.sort(key=itemgetter('keep_alive_interval'))
             
             for result in keep_alive_results:
                 logger.info(f"连接保持间隔: {result['keep_alive_interval']}秒, 平均扫描时间: {result['avg_scan_time']:.2f}秒, 平均每秒处理文件数: {result['avg_files_per_second']:.2f}文件/秒")
             
             # 找出最佳连接保持间隔
-            best_result = max(keep_alive_results, key=lambda x: x['avg_files_per_second'])
+            best_result = _best_by(keep_alive_results, 'avg_files_per_second')
             logger.info(f"最佳连接保持间隔: {best_result['keep_alive_interval']}秒, 性能: {best_result['avg_files_per_second']:.2f}文件/秒")
             
         return keep_alive_results
     
-    def save_results(self, output_file=None):
+    def _record_result(self, result):
+        """把一条结果追加写入结果文件，文件未打开（或已被save_results关闭）时先打开"""
+        with self._sink_lock:
+            if self._sink is None:
+                self._sink = open(self.stream_file, 'ab', buffering=0)
+                logger.info(f"测试结果实时写入: {self.stream_file}")
+            self._sink.write(_dumps_line(result))
+    
+    def _close_sink(self):
+        """关闭结果文件，之后产生的结果会重新打开并继续追加"""
+        with self._sink_lock:
+            if self._sink is not None:
+                self._sink.close()
+                self._sink = None
+    
+    def _load_results(self):
+        """从结果文件读取目前为止的全部结果"""
+        try:
+            with open(self.stream_file, 'rb') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+    
+    def save_results(self, output_file=None, compact=False):
         """保存测试结果到JSON文件
         
         Args:
-            output_file (str): 输出文件路径
+            output_file (str): 输出文件路径，以.jsonl结尾时按JSON Lines格式每行写入一条结果
+            compact (bool): 是否输出不带缩进的紧凑JSON（供脚本读取，体积更小）
         
         Returns:
             str: 保存的文件路径
         """
-        if not self.results:
+        self._stop_keep_alive()
+        self._close_sink()
+        
+        results = self._load_results()
+        if not results:
             logger.warning("没有测试结果可保存")
             return None
         
@@ -340,20 +582,28 @@ class SMBPerformanceTester:
             output_file = f"/tmp/smb_perf_results_{timestamp}.json"
         
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(self.results, f, ensure_ascii=False, indent=2)
+            with open(output_file, 'wb') as f:
+                if output_file.endswith('.jsonl'):
+                    f.write(b''.join(_dumps_line(result) for result in results))
+                elif compact:
+                    f.write(_dumps_compact(results))
+                else:
+                    f.write(_dumps(results))
             logger.info(f"测试结果已保存到: {output_file}")
             return output_file
         except Exception as e:
             logger.error(f"保存测试结果失败: {str(e)}")
             return None
     
-    def run_comprehensive_test(self, path, output_file=None):
+    def run_comprehensive_test(self, path, output_file=None, parallel=False, compact=False):
         """运行全面的性能测试
         
         Args:
             path (str): 要扫描的SMB路径
             output_file (str): 输出文件路径
+            parallel (bool): 是否并行运行各项测试。各项测试共享同一SMB服务器和
+                进程级配置，并行时结果会相互影响，适合快速粗测
+            compact (bool): 是否以不带缩进的紧凑JSON保存结果
         
         Returns:
             dict: 综合测试结果
@@ -363,20 +613,38 @@ class SMBPerformanceTester:
         logger.info(f"测试路径: {path}")
         
         # 记录开始时间
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         # 运行各项测试
-        base_result = self.test_scan_speed(path, iterations=3)
-        thread_results = self.test_thread_pool_size(path, thread_sizes=[2, 4, 6, 8, 10], iterations=2)
-        batch_results = self.test_batch_size(path, batch_sizes=[100, 250, 500, 1000], iterations=2)
-        keep_alive_results = self.test_connection_keep_alive(path, intervals=[5, 10, 30], duration=20, iterations=2)
+        tests = {
+            'base': (self.test_scan_speed, {'iterations': 3}),
+            'thread': (self.test_thread_pool_size, {'thread_sizes': [2, 4, 6, 8, 10], 'iterations': 2}),
+            'batch': (self.test_batch_size, {'batch_sizes': [100, 250, 500, 1000], 'iterations': 2}),
+            'keep_alive': (self.test_connection_keep_alive, {'intervals': [5, 10, 30], 'duration': 20, 'iterations': 2}),
+        }
+        outcomes = {}
+        if parallel:
+            with ThreadPoolExecutor(max_workers=len(tests)) as pool:
+                futures = {pool.submit(func, path, **kwargs): name for name, (func, kwargs) in tests.items()}
+                for future in as_completed(futures):
+                    try:
+                        outcomes[futures[future]] = future.result()
+                    except Exception as e:
+                        logger.error(f"测试 {futures[future]} 失败: {str(e)}")
+                        outcomes[futures[future]] = None
+        else:
+            for name, (func, kwargs) in tests.items():
+                outcomes[name] = func(path, **kwargs)
+        base_result = outcomes['base']
+        thread_results = outcomes['thread'] or []
+        batch_results = outcomes['batch'] or []
+        keep_alive_results = outcomes['keep_alive'] or []
         
         # 记录结束时间
-        end_time = time.time()
-        total_time = end_time - start_time
+        total_time = time.perf_counter() - start_time
         
         # 保存结果
-        result_file = self.save_results(output_file)
+        result_file = self.save_results(output_file, compact=compact)
         
         # 打印综合报告
         self.print_separator()
@@ -391,19 +659,32 @@ class SMBPerformanceTester:
         
         # 线程池大小建议
         if thread_results:
-            best_thread = max(thread_results, key=lambda x: x['avg_files_per_second'])
+            best_thread = _best_by(thread_results, 'avg_files_per_second')
             logger.info(f"建议的线程池大小: {best_thread['thread_size']} (环境变量 SMB_MAX_WORKERS={best_thread['thread_size']})")
+            if best_thread['cpu_utilization'] >= GIL_BOUND_CPU_UTILIZATION:
+                logger.info("扫描受GIL限制（CPU利用率接近单核满载），应减少每个文件的Python处理开销，而不是增加线程数")
+            else:
+                logger.info("扫描主要受I/O限制，线程池可以有效提升并发")
         
         # 批处理大小建议
         if batch_results:
-            best_batch = max(batch_results, key=lambda x: x['avg_files_per_second'])
+            best_batch = _best_by(batch_results, 'avg_files_per_second')
             logger.info(f"建议的批处理大小: {best_batch['batch_size']}")
+            logger.info(f"建议的同时进行中操作数: {best_batch['outstanding']} (环境变量 SMB_MAX_INFLIGHT={best_batch['outstanding']})")
         
         # 连接保持间隔建议
         if keep_alive_results:
-            best_keep_alive = max(keep_alive_results, key=lambda x: x['avg_files_per_second'])
+            best_keep_alive = _best_by(keep_alive_results, 'avg_files_per_second')
             logger.info(f"建议的连接保持间隔: {best_keep_alive['keep_alive_interval']}秒")
         
+        # GIL争用建议
+        gil_values = [r['gil_contention'] for r in self._load_results() if r.get('gil_contention') is not None]
+        if gil_values:
+            avg_gil = statistics.mean(gil_values)
+            logger.info(f"平均GIL争用: {avg_gil:.2f}")
+            if avg_gil > GIL_CONTENTION_THRESHOLD:
+                logger.info("扫描受GIL争用限制，建议改用ProcessPoolExecutor或无GIL的CPython（3.13t）")
+        
         # 通用建议
         logger.info("其他优化建议:")
         logger.info("1. 考虑增加网络带宽或优化网络连接质量")
@@ -430,7 +711,9 @@ if __name__ == "__main__":
         logger.error("  --test=batch_size          只测试不同批处理大小")
         logger.error("  --test=keep_alive          只测试不同连接保持间隔")
         logger.error("  --test=comprehensive       运行全面测试（默认）")
-        logger.error("  --output=<文件路径>        指定结果输出文件")
+        logger.error("  --parallel                 并行运行各项测试及多次迭代（结果会相互影响）")
+        logger.error("  --output=<文件路径>        指定结果输出文件（以.jsonl结尾时每行一条结果）")
+        logger.error("  --compact                  以不带缩进的紧凑JSON保存结果（供脚本读取）")
         logger.error("  --iterations=<次数>        指定测试迭代次数")
         sys.exit(1)
     
@@ -438,6 +721,8 @@ if __name__ == "__main__":
     test_type = 'comprehensive'
     output_file = None
     iterations = 3
+    parallel = False
+    compact = False
     
     # 解析其他参数
     for arg in sys.argv[2:]:
@@ -445,6 +730,10 @@ if __name__ == "__main__":
             test_type = arg.split('=', 1)[1]
         elif arg.startswith('--output='):
             output_file = arg.split('=', 1)[1]
+        elif arg == '--parallel':
+            parallel = True
+        elif arg == '--compact':
+            compact = True
         elif arg.startswith('--iterations='):
             try:
                 iterations = int(arg.split('=', 1)[1])
@@ -458,7 +747,7 @@ if __name__ == "__main__":
         sys.exit(1)
     
     # 创建测试器并运行测试
-    tester = SMBPerformanceTester()
+    tester = SMBPerformanceTester(parallel_iterations=parallel)
     
     try:
         if test_type == 'scan_speed':
@@ -470,14 +759,14 @@ if __name__ == "__main__":
         elif test_type == 'keep_alive':
             tester.test_connection_keep_alive(test_path, iterations=iterations)
         elif test_type == 'comprehensive':
-            tester.run_comprehensive_test(test_path, output_file=output_file)
+            tester.run_comprehensive_test(test_path, output_file=output_file, parallel=parallel, compact=compact)
         else:
             logger.error(f"无效的测试类型: {test_type}")
             sys.exit(1)
         
         # 保存结果（如果没有在comprehensive测试中保存）
         if test_type != 'comprehensive':
-            tester.save_results(output_file)
+            tester.save_results(output_file, compact=compact)
             
         # 成功完成
         sys.exit(0)
@@ -485,7 +774,7 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logger.info("测试被用户中断")
         # 保存已有的结果
-        tester.save_results(output_file)
+        tester.save_results(output_file, compact=compact)
         sys.exit(1)
     except Exception as e:
         logger.error(f"测试过程中发生错误: {str(e)}")
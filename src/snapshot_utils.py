@@ -10,9 +10,11 @@ import hashlib
 import concurrent.futures
 import threading
 import subprocess
-import queue
-from pathlib import Path
+import shutil
+from collections import deque
+from itertools import repeat
 import re
+import string
 import logging
 import socket
 
@@ -34,16 +36,23 @@ def _get_config():
 # 设置socket默认超时时间
 socket.setdefaulttimeout(30)
 
-# 导入新的SMBManager类 - 使用相对导入以适应Docker环境
-from .smb_api import SMBManager
+# 同时进行中的文件元数据/目录读取操作上限：网络文件系统（SMB/WebDAV挂载）
+# 对同一服务器的并发请求过多时服务端排队反而降低吞吐，与线程数分开控制
+SMB_MAX_INFLIGHT = int(os.environ.get('SMB_MAX_INFLIGHT', '16'))
+
+# CloudDrive WebDAV挂载点（NAS和macOS），用于str.startswith判断WebDAV路径
+WEBDAV_MOUNT_PREFIXES = ('/vol02/CloudDrive/WebDAV', '/Volumes/CloudDrive/WebDAV')
+
+# WebDAV并行收集时每批交给线程池的目录数
+WEBDAV_DIR_BATCH_SIZE = 32
+
+# 目录项是否自带文件大小（Windows的FindNextFile会返回，DirEntry.stat()无需系统调用）
+_DIR_ENTRY_HAS_SIZE = os.name == 'nt'
 
 # 导入超时控制工具函数
 from .utils.timeout_decorator import run_with_timeout, timeout_config
 from .utils.environment import env_detector
 
-# 确保Python使用UTF-8编码
-import io
-
 # 错误码常量定义
 ERROR_OK = 0  # 成功
 ERROR_INVALID_ARGS = 1  # 无效参数
@@ -92,6 +101,27 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 处理文件出错时，错误信息包含这些关键词（小写）则视为SMB/WebDAV连接错误
+_CONNECTION_ERROR_KEYWORDS = ('smb', 'connection', 'timeout', 'timed out', 'unavailable', 'disconnect', 'webdav')
+
+# 样本文件特性检测：普通路径字符（ASCII字母数字、空白和._-）的删除表，以及大文件/原盘扩展名和原盘目录关键词
+_PLAIN_PATH_CHARS_TABLE = str.maketrans('', '', string.ascii_letters + string.digits + string.whitespace + '._-')
+_LARGE_FILE_EXTS = frozenset({'.mp4', '.mkv', '.avi', '.iso', '.zip', '.rar'})
+# 原盘文件扩展名（ISO和常见BD/DVD原盘文件格式）
+_DISC_FILE_EXTS = frozenset({'.iso', '.ifo', '.bup', '.vob', '.m2ts', '.mpls', '.bdmv'})
+_DISC_DIR_KEYWORDS = ('bdrip', 'bdmv', 'bluray', 'iso', '原盘', 'raw')
+# 直接从原盘复制的数字序列文件名（如0001、00001.m2ts，主文件名为4位或更长的数字），
+# 在以换行连接的样本路径上逐行匹配
+_DISC_SEQUENCE_NAME_RE = re.compile(r'(?:^|/)\d{4,}(?:\.[^./\n]*)?$', re.MULTILINE)
+
+# is_auxiliary_file对每个文件都会调用，判断所需的集合和正则预先构建
+_AUX_FILE_EXTS = frozenset(AUXILIARY_FILE_EXTENSIONS)
+_AUX_FOLDER_NAMES_LOWER = frozenset(name.lower() for name in AUXILIARY_FOLDER_NAMES)
+# 文件名中的辅助文件标识
+_AUX_KEYWORD_RE = re.compile(r'poster|cover|fanart|discart|folder')
+# 包含辅助文件标识但仍视为普通媒体文件的扩展名（例如：movie_poster_1080p.mkv）
+_MEDIA_FILE_EXTS = frozenset({'.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.m4v'})
+
 def is_auxiliary_file(file_path):
     """
     检查文件是否为辅助文件（海报、字幕等）
@@ -102,32 +132,22 @@ def is_auxiliary_file(file_path):
     Returns:
         bool: 如果是辅助文件则返回True，否则返回False
     """
-    # 获取文件名和扩展名
+    # 获取文件名和扩展名（与os.path.splitext一致，忽略文件名开头的点）
     file_name = os.path.basename(file_path).lower()
-    file_ext = os.path.splitext(file_name)[1].lower()
+    stem, dot, ext = file_name.rpartition('.')
+    file_ext = dot + ext if stem.strip('.') else ''
     
     # 检查扩展名是否在辅助文件扩展名列表中
-    if file_ext in AUXILIARY_FILE_EXTENSIONS:
+    if file_ext in _AUX_FILE_EXTS:
         return True
     
     # [MOD] 2026-02-28 检查文件路径中是否包含辅助文件夹名称 by AI
-    for folder_name in AUXILIARY_FOLDER_NAMES:
-        # 使用路径分隔符统一处理
-        path_parts = file_path.replace('\\', '/').split('/')
-        for part in path_parts:
-            if part.lower() == folder_name.lower():
-                return True
-    
-    # 检查文件名是否包含辅助文件标识
-    auxiliary_keywords = ['poster', 'cover', 'fanart', 'discart', 'folder']
-    for keyword in auxiliary_keywords:
-        if keyword in file_name:
-            # 避免误判包含这些关键词但不是辅助文件的情况
-            # 例如：movie_poster_1080p.mkv 应该被视为普通媒体文件
-            if file_ext not in ['.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.m4v']:
-                return True
+    # 使用路径分隔符统一处理
+    if not _AUX_FOLDER_NAMES_LOWER.isdisjoint(file_path.replace('\\', '/').lower().split('/')):
+        return True
     
-    return False
+    # 检查文件名是否包含辅助文件标识，媒体文件扩展名不受影响
+    return file_ext not in _MEDIA_FILE_EXTS and _AUX_KEYWORD_RE.search(file_name) is not None
 
 def is_auxiliary_folder(folder_path):
     """
@@ -142,42 +162,149 @@ def is_auxiliary_folder(folder_path):
     folder_name = os.path.basename(folder_path).lower()
     return folder_name in AUXILIARY_FOLDER_NAMES
 
+def _walk_scandir(top):
+    """用os.scandir深度优先遍历目录，遍历顺序与os.walk一致，不进入指向目录的软链接
+    
+    平台支持时每个目录以文件描述符打开，DirEntry.stat()相对该描述符获取文件信息，
+    描述符只在产出期间有效；不支持时为None。无法读取的目录被跳过。
+    
+    Args:
+        top (str): 要遍历的根目录
+    
+    Yields:
+        tuple: (目录路径, 子目录项列表, 文件项列表, 目录文件描述符或None)
+    """
+    use_dir_fd = os.scandir in os.supports_fd
+    pending_dirs = [top]
+    while pending_dirs:
+        current_dir = pending_dirs.pop()
+        dir_fd = None
+        try:
+            if use_dir_fd:
+                dir_fd = os.open(current_dir, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+            with os.scandir(current_dir if dir_fd is None else dir_fd) as entries:
+                entries = list(entries)
+        except OSError as e:
+            logger.debug("读取目录失败 %s: %s", current_dir, e)
+            if dir_fd is not None:
+                os.close(dir_fd)
+            continue
+        
+        try:
+            subdir_entries = []
+            file_entries = []
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    subdir_entries.append(entry)
+                else:
+                    file_entries.append(entry)
+            yield current_dir, subdir_entries, file_entries, dir_fd
+        finally:
+            if dir_fd is not None:
+                os.close(dir_fd)
+        
+        pending_dirs.extend(os.path.join(current_dir, entry.name) for entry in reversed(subdir_entries) if not entry.is_symlink())
+
+# 写入快照时每个数据块包含的路径数
+SNAPSHOT_CHUNK_PATHS = 8192
+
+# os.writev一次最多提交的缓冲区数
+try:
+    _IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = 1024
+if _IOV_MAX <= 0:
+    _IOV_MAX = 1024
+
+def _encode_snapshot_chunks(file_paths):
+    """把已排序的路径列表编码为快照数据块列表（每个路径后跟一个\0），编码失败时抛出UnicodeEncodeError"""
+    return [('\x00'.join(file_paths[i:i + SNAPSHOT_CHUNK_PATHS]) + '\x00').encode('utf-8')
+            for i in range(0, len(file_paths), SNAPSHOT_CHUNK_PATHS)]
+
+def _write_all(fd, data):
+    """把data完整写入文件描述符，处理部分写入"""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def _write_buffers(fd, buffers):
+    """把多个缓冲区按顺序写入文件描述符：支持时用os.writev每次提交最多_IOV_MAX个缓冲区"""
+    if not hasattr(os, 'writev'):
+        for buffer in buffers:
+            _write_all(fd, buffer)
+        return
+    for start in range(0, len(buffers), _IOV_MAX):
+        group = buffers[start:start + _IOV_MAX]
+        written = os.writev(fd, group)
+        # 部分写入时从第一个未写完的缓冲区开始补写
+        for buffer in group:
+            if written >= len(buffer):
+                written -= len(buffer)
+                continue
+            _write_all(fd, memoryview(buffer)[written:])
+            written = 0
+
 def handle_error(error_code, message):
     """处理错误并返回错误码"""
     logger.error(f"错误 {error_code}: {message}")
     return error_code
 
-def calculate_checksum(file_path, algorithm='md5'):
+# 计算校验和时每次读取的字节数，大块读取减少Python层循环和网络文件系统的往返次数
+CHECKSUM_CHUNK_SIZE = int(os.environ.get('CHECKSUM_CHUNK_SIZE', str(1 << 20)))
+
+# 默认校验和算法：blake2b比md5快且同样只用于完整性校验；可通过SNAPSHOT_HASH环境变量指定其他算法
+HASH_ALGO = os.environ.get('SNAPSHOT_HASH', 'blake2b')
+
+def _new_hash(algorithm):
+    """创建哈希对象；blake2b使用16字节摘要，与md5校验和长度一致"""
+    if algorithm == 'blake2b':
+        return hashlib.blake2b(digest_size=16)
+    return hashlib.new(algorithm)
+
+def calculate_checksum(file_path, algorithm=HASH_ALGO):
     """计算文件的校验和
     
     Args:
         file_path (str): 文件路径
-        algorithm (str): 哈希算法，默认为'md5'
+        algorithm (str): 哈希算法，默认为HASH_ALGO（blake2b）
         
     Returns:
         str: 文件的校验和，如果计算失败则返回None
     """
     try:
-        hash_obj = hashlib.new(algorithm)
-        with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b''):
+        # 不使用Python层缓冲，每次read直接读取整块数据
+        with open(file_path, 'rb', buffering=0) as f:
+            # Python 3.11+在C中完成读取和哈希循环
+            if hasattr(hashlib, 'file_digest'):
+                return hashlib.file_digest(f, lambda: _new_hash(algorithm)).hexdigest()
+            hash_obj = _new_hash(algorithm)
+            while True:
+                chunk = f.read(CHECKSUM_CHUNK_SIZE)
+                if not chunk:
+                    break
                 hash_obj.update(chunk)
         return hash_obj.hexdigest()
     except Exception as e:
         logger.error(f"计算校验和失败 ({file_path}): {str(e)}")
         return None
 
-def verify_checksum(file_path, expected_checksum, algorithm='md5'):
+def verify_checksum(file_path, expected_checksum, algorithm=HASH_ALGO):
     """验证文件的校验和
     
     Args:
         file_path (str): 文件路径
-        expected_checksum (str): 期望的校验和
-        algorithm (str): 哈希算法，默认为'md5'
+        expected_checksum (str): 期望的校验和，可以是"算法:十六进制值"形式，此时使用其中的算法
+        algorithm (str): 哈希算法，默认为HASH_ALGO（blake2b）
         
     Returns:
         bool: 校验是否通过
     """
+    if ':' in expected_checksum:
+        algorithm, expected_checksum = expected_checksum.split(':', 1)
     current_checksum = calculate_checksum(file_path, algorithm)
     if current_checksum is None:
         return False
@@ -196,9 +323,13 @@ def keep_smb_alive(smb_path, interval=15, timeout=5):
     - 在Docker环境中，/vol02/CloudDrive/WebDAV是通过Docker卷直接挂载到容器内的
     - 这种挂载方式不需要在容器内进行SMB连接操作
     - 宿主机上的SMB挂载保持由宿主机系统负责，不受容器内操作影响
+    - 扫描代码每次成功访问路径后调用返回线程的touch()方法，
+      距离上次访问不足interval秒时跳过本轮检查，避免在扫描进行中重复请求服务器
     """
     # 创建一个事件对象用于停止线程
     stop_event = threading.Event()
+    # 扫描代码最近一次成功访问该路径的时间（time.monotonic）
+    last_access = [0.0]
     
     def _keep_alive():
         # 检查是否在Docker环境中
@@ -214,7 +345,9 @@ def keep_smb_alive(smb_path, interval=15, timeout=5):
             logger.debug(f"Docker环境下SMB连接保持线程已停止: {smb_path}")
             return
 
-        # 获取SMBManager单例实例
+        # 获取SMBManager单例实例（只有需要保持SMB连接时才导入smb_api及其pysmb依赖）
+        # 使用相对导入以适应Docker环境
+        from .smb_api import SMBManager
         smb_manager = SMBManager.get_instance()
         
         # 解析SMB路径以提取服务器和共享信息
@@ -234,7 +367,7 @@ def keep_smb_alive(smb_path, interval=15, timeout=5):
                 server = parts[2]
                 if len(parts) >= 4:
                     share = parts[3]
-        elif smb_path.startswith('/vol02/CloudDrive/WebDAV') or smb_path.startswith('/Volumes/CloudDrive/WebDAV'):
+        elif smb_path.startswith(WEBDAV_MOUNT_PREFIXES):
             # WebDAV特定路径格式
             # 从环境变量获取WebDAV服务器地址，如果没有则使用默认值
             server = os.environ.get('WEBDAV_SERVER', 'localhost')
@@ -242,7 +375,13 @@ def keep_smb_alive(smb_path, interval=15, timeout=5):
             # 对于WebDAV路径，增加专门的日志信息
             logger.debug(f"识别到WebDAV路径: {smb_path}")
         
-        while True:
+        while not stop_event.is_set():
+            # 扫描线程刚访问过该路径时连接本身是活跃的，等到空闲满interval秒再检查
+            idle_time = time.monotonic() - last_access[0]
+            if idle_time < interval:
+                if stop_event.wait(interval - idle_time):
+                    break
+                continue
             try:
                 # 执行实际的SMB操作来保持连接活跃
                 # 使用path_exists操作，这是一个轻量级的操作
@@ -262,7 +401,10 @@ def keep_smb_alive(smb_path, interval=15, timeout=5):
                     logger.debug(f"SMB连接保持失败: {err}")
             except Exception as e:
                 logger.warning(f"SMB连接保持线程异常: {e}")
-            time.sleep(interval)
+            # 等待下一次检查，收到停止信号时立即退出
+            if stop_event.wait(interval):
+                break
+        logger.debug(f"SMB连接保持线程已停止: {smb_path}")
 
     # 启动后台线程
     thread = threading.Thread(target=_keep_alive, daemon=True)
@@ -276,7 +418,12 @@ def keep_smb_alive(smb_path, interval=15, timeout=5):
         thread.join(interval + 1)
         logger.debug(f"已请求停止SMB/WebDAV连接保持线程: {smb_path}")
     
+    def touch():
+        """记录扫描代码对该路径的一次成功访问"""
+        last_access[0] = time.monotonic()
+    
     thread.stop = stop
+    thread.touch = touch
     return thread
 
 def is_docker_environment():
@@ -288,7 +435,7 @@ def is_docker_environment():
     """
     return env_detector.is_docker()
 
-def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=False, large_threshold=10000, min_size=0, min_size_mb=0, retry_count=3, timeout=None):
+def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=False, large_threshold=10000, min_size=0, min_size_mb=0, retry_count=3, timeout=None, file_list=None, max_workers=None, batch_size=None, keep_alive_interval=None):
     """生成目录快照
     
     Args:
@@ -302,6 +449,10 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
         min_size_mb (float): 最小文件大小（MB）
         retry_count (int): 重试次数，默认为3
         timeout (int): 超时时间（秒），默认为300秒（5分钟）
+        file_list (list, optional): 预先收集的文件路径列表，提供时并行处理阶段直接使用，不再遍历目录
+        max_workers (int, optional): 最大线程数，默认读取SMB_MAX_WORKERS环境变量
+        batch_size (int, optional): 批处理大小，默认使用BATCH_SIZE环境变量
+        keep_alive_interval (float, optional): 连接保持间隔（秒），默认按路径类型决定
         
     Returns:
         int: 成功时返回文件数量，失败时返回负的错误码
@@ -331,6 +482,15 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
     # 从utils.timeout_decorator导入超时控制函数
     from .utils.timeout_decorator import run_with_timeout
     
+    # 显式传入的参数优先于环境变量和模块级设置（核心函数内部会重新赋值同名局部变量）
+    requested_max_workers = max_workers
+    requested_batch_size = batch_size
+    
+    # 取消事件：run_with_timeout超时后设置，通知仍在运行的扫描尽快结束
+    cancel_event = threading.Event()
+    # 运行环境在扫描过程中不会改变，只检测一次，供扫描、线程调整和写入校验各处使用
+    is_docker = is_docker_environment()
+    
     # 定义核心生成快照逻辑函数
     def _generate_snapshot_core():
         nonlocal is_webdav_path
@@ -364,11 +524,11 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
             skipped_large = 0
             skipped_auxiliary = 0
             excluded_dir_count = 0
-            start_time = time.time()
+            start_time = time.monotonic()
             
             # 处理大型目录的并行扫描
-            # 从环境变量获取SMB最大线程数配置，如果没有则使用默认值5
-            smb_max_workers = os.environ.get('SMB_MAX_WORKERS', '10')
+            # 从参数或环境变量获取SMB最大线程数配置，如果没有则使用默认值10
+            smb_max_workers = requested_max_workers if requested_max_workers is not None else os.environ.get('SMB_MAX_WORKERS', '10')
             try:
                 smb_max_workers = int(smb_max_workers)
                 # 确保线程数在合理范围内 (5-20) 根据用户要求调整
@@ -384,79 +544,56 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
             max_workers = smb_max_workers
             min_workers = 5  # 线程数下限设为5，确保在用户要求的5-10范围内
             
-            # 从环境变量获取批处理大小配置
-            batch_size = int(os.environ.get('BATCH_SIZE', '1000'))
+            # 从参数或环境变量获取批处理大小配置
+            if requested_batch_size is not None:
+                batch_size = requested_batch_size
+            else:
+                batch_size = int(os.environ.get('BATCH_SIZE', '1000'))
             batch_size = max(100, min(batch_size, 2000))  # 限制在100-2000范围内
             
             error_threshold = 3  # 超过这个错误数就降低线程数
             recovery_threshold = 10  # 连续成功处理这个数量就增加线程数
             adaptive_batch_delay = scan_delay
             smb_errors = []  # 记录SMB连接错误
+            # 限制同时进行中的网络文件系统操作数
+            inflight = threading.BoundedSemaphore(max(1, SMB_MAX_INFLIGHT))
             
-            # 创建全局预取缓存
-            class PrefetchCache:
-                """SMB文件预取缓存"""
-                def __init__(self, max_size=1000):
-                    self.cache = {}
-                    self.max_size = max_size
-                    self.lock = threading.RLock()
-                    self.usage_count = {}
-                
-                def add(self, path, data):
-                    """添加数据到缓存"""
-                    with self.lock:
-                        # 如果缓存已满，移除使用次数最少的项
-                        if len(self.cache) >= self.max_size and path not in self.cache:
-                            # 找到使用次数最少的项
-                            least_used = min(self.usage_count.items(), key=lambda x: x[1])[0]
-                            del self.cache[least_used]
-                            del self.usage_count[least_used]
-                        
-                        # 添加新数据
-                        self.cache[path] = data
-                        self.usage_count[path] = 0
-                
-                def get(self, path):
-                    """从缓存获取数据"""
-                    with self.lock:
-                        if path in self.cache:
-                            # 增加使用次数
-                            self.usage_count[path] += 1
-                            return self.cache[path]
-                        return None
-                
-                def clear(self):
-                    """清空缓存"""
-                    with self.lock:
-                        self.cache.clear()
-                        self.usage_count.clear()
+            # 扫描过程中不变的配置只读取一次，供process_file/process_directory等内部函数直接使用
+            webdav_prefix_tuple = tuple(webdav_prefixes)
+            # 扫描目录是否位于CloudDrive WebDAV挂载点下（扫描过程中不变，只判断一次）
+            is_webdav_mount = dir.startswith(WEBDAV_MOUNT_PREFIXES)
+            # WebDAV扫描延迟（默认0.01秒）和目录读取重试次数
+            webdav_scan_delay = float(os.environ.get('WEBDAV_SCAN_DELAY', '0.01'))
+            webdav_dir_retry_count = int(os.environ.get('WEBDAV_DIRECTORY_RETRY', '5'))
             
-            # 创建预取缓存实例
-            prefetch_cache = PrefetchCache()
+            # 遍历目录时已经得到的文件大小
+            known_sizes = {}
             
             # 尝试保持SMB/WebDAV连接活跃
-            if dir.startswith('/vol02/CloudDrive/WebDAV') or dir.startswith('/Volumes/CloudDrive/WebDAV'):
+            if is_webdav_mount:
                 # 识别WebDAV路径并启动连接保持线程
-                if is_docker_environment():
+                if is_docker:
                     # 在Docker环境中，路径通过卷挂载
                     logger.debug(f"Docker环境下检测到WebDAV路径: {dir}，使用卷挂载方式访问")
                     # 即使在Docker环境中，也为WebDAV路径启动连接保持线程，因为WebDAV连接可能不稳定
-                    webdav_interval = int(os.environ.get('WEBDAV_KEEP_ALIVE_INTERVAL', '8'))
+                    webdav_interval = keep_alive_interval or int(os.environ.get('WEBDAV_KEEP_ALIVE_INTERVAL', '8'))
                     logger.info(f"检测到WebDAV路径，启动连接保持线程: {dir} (间隔: {webdav_interval}秒)")
                     smb_thread = keep_smb_alive(dir, interval=webdav_interval, timeout=10)  # 增加WebDAV超时时间
                 else:
-                    webdav_interval = int(os.environ.get('WEBDAV_KEEP_ALIVE_INTERVAL', '6'))
+                    webdav_interval = keep_alive_interval or int(os.environ.get('WEBDAV_KEEP_ALIVE_INTERVAL', '6'))
                     logger.info(f"检测到WebDAV路径，启动连接保持线程: {dir} (间隔: {webdav_interval}秒)")
                     smb_thread = keep_smb_alive(dir, interval=webdav_interval, timeout=10)
             elif dir.startswith('//'):
                 # 标准SMB路径
-                if is_docker_environment():
+                if is_docker:
                     logger.debug(f"Docker环境下检测到SMB路径: {dir}，使用卷挂载方式访问")
                 else:
                     logger.info(f"检测到SMB路径，启动连接保持线程: {dir}")
-                smb_thread = keep_smb_alive(dir, interval=15, timeout=5)
+                smb_thread = keep_smb_alive(dir, interval=keep_alive_interval or 15, timeout=5)
             else:
                 smb_thread = None
+            # 扫描过程中成功访问路径后通知连接保持线程，使其在扫描活跃期间跳过检查
+            touch_connection = smb_thread.touch if smb_thread is not None else (lambda: None)
             
             # 确定是否需要使用并行处理
             use_parallel = False
@@ -470,38 +607,47 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                 if max_files == 0 or max_files > 1000:
                     use_parallel = True
             
+            # process_file对每个文件调用一次，常用的函数和方法预先绑定为局部名称，
+            # 避免每次调用都查找全局变量和属性
+            _is_auxiliary_file = is_auxiliary_file
+            _stat = os.stat
+            _known_size = known_sizes.get
+            _append_path = file_paths.append
+            
             # 用于并行处理的函数，支持动态线程调整
-            def process_file(file_path):
+            # 提供dir_fd和name时，相对于已打开的目录获取文件信息，内核只需解析最后一级路径
+            def process_file(file_path, dir_fd=None, name=None):
                 nonlocal file_paths, skipped_small, skipped_large, error_count, success_count, current_workers, adaptive_batch_delay, smb_errors
                 # 添加辅助文件计数变量
                 nonlocal skipped_auxiliary
                 try:
                     # 对所有路径类型（包括Docker环境下的卷挂载路径）都进行辅助文件检查
-                    if is_auxiliary_file(file_path):
-                        logger.debug(f"跳过辅助文件: {file_path}")
+                    if _is_auxiliary_file(file_path):
+                        # 逐文件的调试日志使用延迟格式化，未启用DEBUG时不构造日志字符串
+                        logger.debug("跳过辅助文件: %s", file_path)
                         skipped_auxiliary += 1
                         return False
                     
-                    # [MOD] 2026-02-28 检查软链接目标是否存在 by AI
-                    if os.path.islink(file_path):
-                        # 软链接：检查目标是否存在
-                        if not os.path.exists(file_path):
-                            # 软链接目标不存在，跳过但不报错
-                            logger.debug(f"软链接目标不存在: {file_path}")
-                            skipped_auxiliary += 1
-                            return False
-                    
-                    file_size = 0
-                    # 尝试从预取缓存获取文件信息
-                    file_info = prefetch_cache.get(file_path)
-                    
-                    if file_info:
-                        file_size = file_info
-                    else:
-                        # 检查文件大小
-                        file_size = os.path.getsize(file_path)
-                        # 添加到预取缓存
-                        prefetch_cache.add(file_path, file_size)
+                    # 优先使用遍历目录时已经得到的文件大小
+                    file_size = _known_size(file_path)
+                    if file_size is None:
+                        # 一次stat同时完成存在性检查和大小获取（跟随软链接），
+                        # 只有失败时才额外判断是否为失效的软链接
+                        try:
+                            with inflight:
+                                if dir_fd is None:
+                                    file_size = _stat(file_path).st_size
+                                else:
+                                    file_size = _stat(name, dir_fd=dir_fd).st_size
+                            touch_connection()
+                        except FileNotFoundError:
+                            # [MOD] 2026-02-28 检查软链接目标是否存在 by AI
+                            if os.path.islink(file_path):
+                                # 软链接目标不存在，跳过但不报错
+                                logger.debug("软链接目标不存在: %s", file_path)
+                                skipped_auxiliary += 1
+                                return False
+                            raise
                     
                     # 跳过小于最小大小的文件
                     if min_size_bytes > 0 and file_size < min_size_bytes:
@@ -513,8 +659,8 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                         skipped_large += 1
                         return False
                     
-                    # 添加文件路径到列表
-                    file_paths.append(file_path.encode('utf-8'))
+                    # 添加文件路径到列表（写入快照前统一编码）
+                    _append_path(file_path)
                     
                     # 成功处理，增加成功计数
                     success_count += 1
@@ -528,10 +674,11 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                 except Exception as e:
                     error_msg = str(e)
                     # 检查是否是WebDAV路径的特殊处理
-                    is_webdav_file = any(file_path.startswith(prefix) for prefix in webdav_prefixes)
+                    is_webdav_file = file_path.startswith(webdav_prefix_tuple)
                     
                     # 检测连接错误
-                    if any(kw in error_msg.lower() for kw in ['smb', 'connection', 'timeout', 'timed out', 'unavailable', 'disconnect', 'webdav']):
+                    error_msg_lower = error_msg.lower()
+                    if any(kw in error_msg_lower for kw in _CONNECTION_ERROR_KEYWORDS):
                         # 增加连接错误计数
                         error_count += 1
                         if is_webdav_file:
@@ -560,49 +707,52 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                 temp_file_paths = []
                 
                 # 检测是否是WebDAV路径
-                is_webdav_path = dir.startswith(('/vol02/CloudDrive/WebDAV', '/Volumes/CloudDrive/WebDAV'))
+                is_webdav_path = is_webdav_mount
                 
                 # 记录开始收集文件的时间
-                collect_start_time = time.time()
+                collect_start_time = time.monotonic()
                 
-                if is_webdav_path:
+                if file_list is not None:
+                    # 使用调用方提供的文件列表，跳过目录遍历
+                    temp_file_paths = list(file_list)
+                    if max_files > 0:
+                        temp_file_paths = temp_file_paths[:max_files]
+                    logger.debug(f"使用预先收集的文件列表: {len(temp_file_paths)} 个文件")
+                elif is_webdav_path:
                     # WebDAV路径专用优化：使用线程池并行收集文件路径
                     logger.debug(f"[WebDAV] 开始并行收集文件路径...")
                     
                     # 预创建目录队列和结果队列
-                    dir_queue = queue.Queue()
-                    dir_queue.put(dir)
+                    # 目录工作队列只由主线程读写（线程池只负责读取目录），用deque即可，无需Queue的锁
+                    dir_queue = deque([dir])
                     collected_files = []
                     
-                    # 使用线程安全的锁和计数器
-                    file_lock = threading.Lock()
-                    dir_count_lock = threading.Lock()
-                    error_lock = threading.Lock()
-                    error_dirs = set()  # 记录处理失败的目录
-                    
-                    # 定义目录处理函数
+                    # 定义目录处理函数：只读取目录，返回(子目录列表, 文件列表)，
+                    # 由主线程统一合并结果，工作线程之间不共享可变状态
                     def process_directory(directory):
-                        nonlocal dir_count
                         try:
                             # 对于WebDAV路径，添加额外的延迟控制，避免连接风暴
-                            if is_webdav_path:
-                                # 从环境变量获取WebDAV扫描延迟，默认0.01秒
-                                web_delay = float(os.environ.get('WEBDAV_SCAN_DELAY', '0.01'))
-                                if web_delay > 0:
-                                    time.sleep(web_delay)  # 添加延迟，控制请求频率
+                            if is_webdav_path and webdav_scan_delay > 0:
+                                time.sleep(webdav_scan_delay)  # 添加延迟，控制请求频率
                             # 获取目录内容 - 为WebDAV路径添加重试机制
                             items = None
-                            retry_count = int(os.environ.get('WEBDAV_DIRECTORY_RETRY', '5'))
+                            retry_count = webdav_dir_retry_count
                             retry_delay = 1.5
                              
                             for attempt in range(retry_count):
                                 try:
-                                    items = os.listdir(directory)
+                                    # 使用os.scandir，目录项自带文件类型，判断文件/目录时通常不需要额外的stat请求
+                                    with inflight:
+                                        with os.scandir(directory) as entries:
+                                            items = list(entries)
+                                    touch_connection()
                                     break
                                 except Exception as e:
                                     if attempt < retry_count - 1:
                                         logger.warning(f"[WebDAV] 读取目录内容失败，正在重试 ({attempt+1}/{retry_count}): {str(e)}")
-                                        time.sleep(retry_delay)
+                                        # 退避等待期间快照被取消（例如超时）时立即放弃该目录
+                                        if cancel_event.wait(retry_delay):
+                                            return [], []
                                         retry_delay *= 1.5  # 指数退避
                                     else:
                                         logger.error(f"[WebDAV] 读取目录内容失败: {str(e)}")
@@ -613,45 +763,26 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                             current_files = []
                             
                             if items:
-                                for item in items:
-                                    item_path = os.path.join(directory, item)
+                                for entry in items:
+                                    item_path = entry.path
                                     # [MOD] 2026-02-24 先检查是否为辅助文件夹，跳过不存在的虚拟目录 by AI
                                     if is_auxiliary_folder(item_path):
-                                        logger.debug(f"跳过辅助文件夹: {item_path}")
+                                        logger.debug("跳过辅助文件夹: %s", item_path)
                                         continue
                                     
-                                    # 为WebDAV路径添加额外的文件/目录检查
+                                    # 为WebDAV路径添加额外的文件/目录检查（与os.path.isdir/isfile一致，跟随软链接）
                                     try:
-                                        if os.path.isdir(item_path):
+                                        if entry.is_dir():
                                             current_dirs.append(item_path)
-                                        elif os.path.isfile(item_path):
+                                        elif entry.is_file():
                                             current_files.append(item_path)
                                     except Exception as e:
                                         logger.warning(f"[WebDAV] 检查项目类型失败 {item_path}: {str(e)}")
                             
-                            # 更新目录计数
-                            with dir_count_lock:
-                                dir_count += len(current_dirs)
-                            
-                            # 添加文件到结果列表
-                            with file_lock:
-                                collected_files.extend(current_files)
-                                
-                                # 检查是否达到最大文件数
-                                if max_files > 0 and len(collected_files) >= max_files:
-                                    # 截断列表到最大文件数
-                                    collected_files[:] = collected_files[:max_files]
-                                    return False  # 表示已达到最大文件数
-                            
-                            # 添加子目录到队列
-                            for subdir in current_dirs:
-                                if not (max_files > 0 and len(collected_files) >= max_files):
-                                    dir_queue.put(subdir)
-                            
-                            return True
+                            return current_dirs, current_files
                         except Exception as e:
                             logger.warning(f"[WebDAV] 处理目录 {directory} 时出错: {str(e)}")
-                            return True
+                            return [], []
                     
                     # 创建专门用于收集文件的线程池
                     # 针对小文件集合优化：WebDAV路径即使文件少也使用并行收集
@@ -662,26 +793,29 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                     collector_executor = concurrent.futures.ThreadPoolExecutor(max_workers=collector_workers)
                     
                     # 开始并行处理目录
-                    while not dir_queue.empty() and not (max_files > 0 and len(collected_files) >= max_files):
-                        futures = []
+                    reached_max_files = False
+                    while dir_queue and not reached_max_files and not cancel_event.is_set():
+                        # 一次取出一批目录交给线程池（不要覆盖文件处理用的batch_size）
+                        dir_batch = [dir_queue.popleft() for _ in range(min(WEBDAV_DIR_BATCH_SIZE, len(dir_queue)))]
                         
-                        # 一次处理多个目录
-                        batch_size = min(5, dir_queue.qsize())
-                        for _ in range(batch_size):
-                            if dir_queue.empty() or (max_files > 0 and len(collected_files) >= max_files):
-                                break
+                        # 按提交顺序取回这一批的结果，在主线程中合并，无需加锁
+                        for current_dirs, current_files in collector_executor.map(process_directory, dir_batch):
+                            dir_count += len(current_dirs)
+                            collected_files.extend(current_files)
                             
-                            current_dir = dir_queue.get()
-                            future = collector_executor.submit(process_directory, current_dir)
-                            futures.append(future)
-                        
-                        # 等待这一批处理完成
-                        for future in concurrent.futures.as_completed(futures):
-                            if not future.result() or (max_files > 0 and len(collected_files) >= max_files):
+                            # 检查是否达到最大文件数
+                            if max_files > 0 and len(collected_files) >= max_files:
+                                # 截断列表到最大文件数
+                                del collected_files[max_files:]
+                                reached_max_files = True
                                 break
+                            
+                            # 添加子目录到队列
+                            for subdir in current_dirs:
+                                dir_queue.append(subdir)
                         
                         # 检查是否达到最大文件数
-                        if max_files > 0 and len(collected_files) >= max_files:
+                        if reached_max_files:
                             break
                         
                         # 小延迟避免过度请求
@@ -693,26 +827,49 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                     # 复制结果到temp_file_paths
                     temp_file_paths = collected_files
                     
-                    collect_time = time.time() - collect_start_time
+                    collect_time = time.monotonic() - collect_start_time
                     logger.debug(f"[WebDAV] 并行收集文件完成: {len(temp_file_paths)} 个文件, 耗时 {collect_time:.2f} 秒")
                 else:
-                    # 非WebDAV路径保持原有逻辑
-                    for root, dirs, files in os.walk(dir):
-                        dir_count += len(dirs)
-                        
-                        # 添加文件路径到临时列表
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            temp_file_paths.append(file_path)
-                            
-                            # 检查是否超过最大文件数
-                            if max_files > 0 and len(temp_file_paths) >= max_files:
-                                break
+                    # 非WebDAV路径：用显式栈和os.scandir深度优先遍历（与os.walk顺序一致），
+                    # 文件/目录类型直接取自目录项，不需要额外的stat
+                    pending_dirs = [dir]
+                    while pending_dirs:
+                        current_dir = pending_dirs.pop()
+                        subdirs = []
+                        try:
+                            with os.scandir(current_dir) as entries:
+                                for entry in entries:
+                                    try:
+                                        is_dir = entry.is_dir()
+                                    except OSError:
+                                        is_dir = False
+                                    if is_dir:
+                                        dir_count += 1
+                                        # 与os.walk一致：不进入指向目录的软链接
+                                        if not entry.is_symlink():
+                                            subdirs.append(entry.path)
+                                        continue
+                                    temp_file_paths.append(entry.path)
+                                    # Windows上目录项自带文件大小，直接记录，省去process_file中的stat；
+                                    # 其他平台上entry.stat()仍是一次系统调用，留给并行的process_file完成
+                                    if _DIR_ENTRY_HAS_SIZE:
+                                        try:
+                                            known_sizes[entry.path] = entry.stat().st_size
+                                        except OSError:
+                                            pass
+                                    
+                                    # 检查是否超过最大文件数
+                                    if max_files > 0 and len(temp_file_paths) >= max_files:
+                                        break
+                            touch_connection()
+                        except OSError as e:
+                            logger.debug("读取目录失败 %s: %s", current_dir, e)
                         
                         # 如果已达到最大文件数，停止遍历
                         if max_files > 0 and len(temp_file_paths) >= max_files:
-                            excluded_dir_count += len(dirs) - len(os.walk(root))
+                            excluded_dir_count += len(pending_dirs) + len(subdirs)
                             break
+                        pending_dirs.extend(reversed(subdirs))
                 
                 logger.info(f"开始并行处理 {len(temp_file_paths)} 个文件 (初始线程数: {current_workers}, 最大线程数: {max_workers})...")
                 
@@ -729,9 +886,6 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                 has_large_files = False
                 has_disc_files = False
                 
-                # 检测是否是WebDAV路径
-                is_webdav_path = dir.startswith(('/vol02/CloudDrive/WebDAV', '/Volumes/CloudDrive/WebDAV'))
-                
                 # 为WebDAV路径设置更合适的初始延迟
                 if is_webdav_path:
                     adaptive_batch_delay = max(scan_delay * 1.5, adaptive_batch_delay)  # WebDAV路径使用更大的初始延迟
@@ -739,56 +893,40 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                 # 采样前10个文件来判断目录特性，避免对大量文件进行检测
                 sample_size = min(10, len(temp_file_paths))
                 sample_files = temp_file_paths[:sample_size]
+                # 样本文件是否位于配置的WebDAV路径下，后续延迟和线程数策略共用这一结果
+                is_webdav_sample = any(path.startswith(webdav_prefix_tuple) for path in sample_files[:3])
                 
-                # 检查特殊字符
-                for file_path in sample_files:
-                    if any(not c.isalnum() and not c.isspace() and c not in '._-' for c in file_path):
-                        has_special_chars = True
-                        break
+                # 数字序列文件名由正则在连接后的样本路径上一次匹配完成
+                has_disc_files = _DISC_SEQUENCE_NAME_RE.search('\n'.join(sample_files)) is not None
                 
-                # 检查大文件（通过文件大小或扩展名判断）
-                large_file_extensions = {'.mp4', '.mkv', '.avi', '.iso', '.zip', '.rar'}
-                # 原盘文件扩展名（ISO和常见BD/DVD原盘文件格式）
-                disc_extensions = {'.iso', '.ifo', '.bup', '.vob', '.m2ts', '.mpls', '.bdmv'}
+                # 一次遍历样本文件，同时检查特殊字符、大文件/原盘扩展名和原盘目录关键词
+                has_disc_dir_keyword = False
                 for file_path in sample_files:
-                    _, ext = os.path.splitext(file_path.lower())
-                    if ext in large_file_extensions:
+                    # 检查特殊字符：先用translate去掉常见的ASCII字符，只对剩余字符逐个判断
+                    if not has_special_chars:
+                        remaining = file_path.translate(_PLAIN_PATH_CHARS_TABLE)
+                        if remaining and any(not c.isalnum() and not c.isspace() for c in remaining):
+                            has_special_chars = True
+                    
+                    parent_dir, file_name = os.path.split(file_path)
+                    ext = os.path.splitext(file_name)[1].lower()
+                    # 检查大文件（通过扩展名判断）
+                    if ext in _LARGE_FILE_EXTS:
                         has_large_files = True
-                    if ext in disc_extensions:
+                    # 原盘文件扩展名
+                    if ext in _DISC_FILE_EXTS:
                         has_disc_files = True
                     
-                    # 检查是否为直接从原盘复制的数字序列文件名（如0001, 0002等）
-                    file_name = os.path.basename(file_path)
-                    base_name, _ = os.path.splitext(file_name)
-                    if base_name.isdigit() and len(base_name) >= 4:
-                        # 长度为4或更长的纯数字文件名，很可能是原盘文件
-                        has_disc_files = True
-                        break
+                    # 检查是否为电影原盘目录（通过所在目录名判断）
+                    if not has_disc_dir_keyword:
+                        parent_name = os.path.basename(parent_dir).lower()
+                        has_disc_dir_keyword = any(keyword in parent_name for keyword in _DISC_DIR_KEYWORDS)
                 
-                # 检查是否为电影原盘目录（通过路径判断）
-                if any(keyword in os.path.basename(os.path.dirname(file_path)).lower() for file_path in sample_files for keyword in ['bdrip', 'bdmv', 'bluray', 'iso', '原盘', 'raw']):
-                    # 在WebDAV路径下，需要更谨慎地判断是否为真的原盘目录
-                    is_webdav_sample = any(any(path.startswith(prefix) for prefix in webdav_prefixes) for path in sample_files[:3])
-                    
-                    if is_webdav_sample:
-                        # WebDAV路径下，只有同时满足多个条件才被识别为原盘目录
-                        # 1. 包含原盘相关关键词
-                        # 2. 包含原盘扩展名文件或纯数字文件名
-                        has_disc_indicators = False
-                        for file_path in sample_files:
-                            _, ext = os.path.splitext(file_path.lower())
-                            if ext in disc_extensions:
-                                has_disc_indicators = True
-                                break
-                            file_name = os.path.basename(file_path)
-                            base_name, _ = os.path.splitext(file_name)
-                            if base_name.isdigit() and len(base_name) >= 4:
-                                has_disc_indicators = True
-                                break
-                        
-                        if has_disc_indicators:
-                            has_disc_files = True
-                    else:
+                if has_disc_dir_keyword:
+                    # 在WebDAV路径下，需要更谨慎地判断是否为真的原盘目录：
+                    # 只有同时包含原盘扩展名文件或纯数字文件名才被识别为原盘目录，
+                    # 这一条件已在上面的遍历中计入has_disc_files
+                    if not is_webdav_sample:
                         # 非WebDAV路径，保持原有判断逻辑
                         has_disc_files = True
 
@@ -800,38 +938,16 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                 # 从环境变量获取批处理延迟配置
                 env_batch_delay = float(os.environ.get('BATCH_DELAY', '0.001'))
                 
-                if is_docker_environment():
-                    # Docker环境下的批处理延迟优化（卷挂载模式）
-                    logger.debug(f"Docker环境下优化批处理延迟")
-                    is_webdav_sample = any(any(path.startswith(prefix) for prefix in webdav_prefixes) for path in sample_files[:3])
-                    
-                    # 针对原盘目录（大量小文件）使用更激进的延迟策略
-                    if has_disc_files:
-                        logger.debug(f"原盘目录优化批处理延迟")
-                        # 原盘目录通常包含大量小文件，需要更激进的延迟策略
-                        batch_delay = max(env_batch_delay, 0.001)
-                    # 针对WebDAV路径使用专用的批处理延迟优化
-                    elif is_webdav_sample:
-                        logger.debug(f"[WebDAV] 优化批处理延迟")
-                        # WebDAV路径在Docker环境下通常可以使用更激进的延迟策略
-                        batch_delay = max(env_batch_delay, 0.001)
-                    else:
-                        # 普通Docker环境目录
-                        # Docker环境下使用更小的初始延迟，因为卷挂载通常比SMB连接更稳定
-                        batch_delay = max(env_batch_delay, 0.001)
-                else:
-                    # 非Docker环境保持原有策略
-                    batch_delay = max(env_batch_delay, 0.01)
+                # 批处理延迟下限只取决于运行环境：Docker环境（卷挂载）比直接访问SMB连接更稳定，使用更小的下限；
+                # 原盘目录、WebDAV路径和普通目录在同一环境下取值相同
+                batch_delay = max(env_batch_delay, 0.001 if is_docker else 0.01)
                 
-                logger.debug(f"批处理延迟设置为 {batch_delay:.2f}s (特殊字符: {has_special_chars}, 大文件: {has_large_files}, 原盘文件: {has_disc_files})")
+                logger.debug(f"批处理延迟设置为 {batch_delay:.2f}s (Docker: {is_docker}, WebDAV: {is_webdav_sample}, 特殊字符: {has_special_chars}, 大文件: {has_large_files}, 原盘文件: {has_disc_files})")
                 
                 logger.info(f"批处理设置: 每批{batch_size}个文件, 共{total_batches}批, 初始批延迟{batch_delay:.2f}秒")
                 
                 # 为Docker环境优化初始线程数
-                if is_docker_environment():
-                    # 检测是否是WebDAV路径
-                    is_webdav_sample = any(any(path.startswith(prefix) for prefix in webdav_prefixes) for path in sample_files[:3])
-                     
+                if is_docker:
                     # 针对原盘目录（大量小文件）使用更激进的初始线程数策略
                     if has_disc_files:
                         # 原盘目录通常包含大量小文件，需要更多初始线程
@@ -847,7 +963,6 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                         # Docker环境下增加初始线程数，因为卷挂载通常比SMB连接更能处理并行
                         docker_initial_workers = min(max_workers, current_workers + 2)  # 增加2个初始线程
                         logger.info(f"Docker环境下优化初始线程数: {current_workers} -> {docker_initial_workers}")
-                    executor = concurrent.futures.ThreadPoolExecutor(max_workers=docker_initial_workers)
                     current_workers = docker_initial_workers
                 else:
                     # 非Docker环境保持原有设置
@@ -856,35 +971,73 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                         # 小文件集合使用较少线程，避免连接过多
                         current_workers = min(current_workers, 2)
                         logger.info(f"[WebDAV] 小文件集合优化，调整线程数: {max_workers} -> {current_workers}")
-                    executor = concurrent.futures.ThreadPoolExecutor(max_workers=current_workers)
-                futures = []
-                batch_count = 0
+                
+                # 线程池只创建一次（按最大线程数），实际并发数由许可数量控制，调整线程数时只增减许可，
+                # 不再关闭并重建线程池，工作线程及其持有的连接在整个扫描过程中保持不变
+                executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(max_workers, current_workers))
+                worker_permits = threading.Semaphore(current_workers)
+                submit = executor.submit
+                # 任一任务报告达到最大文件数时置位，提交循环只需检查这个事件，不必遍历所有已提交的future
+                max_files_reached = threading.Event()
+                
+                def process_file_with_permit(file_path):
+                    with worker_permits:
+                        if process_file(file_path):
+                            max_files_reached.set()
+                            return True
+                        return False
+                
+                def resize_workers(new_workers):
+                    """把同时处理文件的线程数调整为new_workers"""
+                    nonlocal current_workers
+                    delta = new_workers - current_workers
+                    if delta > 0:
+                        for _ in range(delta):
+                            worker_permits.release()
+                    elif delta < 0:
+                        # 收回许可：由后台线程等待正在处理的任务归还许可后取走，不阻塞提交循环
+                        def drain_permits(count=-delta):
+                            for _ in range(count):
+                                worker_permits.acquire()
+                        threading.Thread(target=drain_permits, daemon=True).start()
+                    current_workers = new_workers
+                
+                # 尚未完成的任务：完成时由回调移除，停止时只需取消其中的任务，已完成的future可以尽早回收
+                pending_futures = set()
+                # 已提交但尚未确认完成的批次（每项为该批的future列表），按提交顺序排列
+                in_flight_batches = deque()
+                
+                # 当前处理速度（文件/秒），每批计算一次；计算之前为0
+                processing_speed = 0.0
                 
                 # 处理每一批文件
                 for i in range(0, len(temp_file_paths), batch_size):
                     batch = temp_file_paths[i:i+batch_size]
-                    futures.extend(executor.submit(process_file, file_path) for file_path in batch)
+                    batch_futures = list(map(submit, repeat(process_file_with_permit), batch))
+                    for future in batch_futures:
+                        pending_futures.add(future)
+                        future.add_done_callback(pending_futures.discard)
                     
-                    batch_count += 1
-                    if scan_delay > 0 and batch_count > 1:
-                        time.sleep(batch_delay)
-                    
-                    # 检查是否有线程报告达到最大文件数
-                    reached_max_files = False
-                    for future in futures:
-                        if future.done() and future.result():
-                            reached_max_files = True
-                            break
+                    # 连续提交多批，在途批次达到窗口大小后等待最早的一批完成（最多等待batch_delay），
+                    # 批间延迟与实际I/O时间重叠，最早一批提前完成时不再空等
+                    if scan_delay > 0:
+                        in_flight_batches.append(batch_futures)
+                        in_flight_window = max(1, min(total_batches, current_workers * 2))
+                        while len(in_flight_batches) >= in_flight_window:
+                            oldest_batch = in_flight_batches.popleft()
+                            _, not_done = concurrent.futures.wait(oldest_batch, timeout=batch_delay)
+                            if not_done:
+                                # 超时后不再等待这一批，继续提交
+                                break
                     
-                    # 如果达到最大文件数，取消所有未完成的任务
-                    if reached_max_files or (max_files > 0 and len(file_paths) >= max_files):
-                        for f in futures:
-                            if not f.done():
-                                f.cancel()
+                    # 如果有线程报告达到最大文件数，取消所有未完成的任务
+                    if max_files_reached.is_set():
+                        for future in list(pending_futures):
+                            future.cancel()
                         break
                        
-                    # 计算当前处理速度（文件/秒）
-                    current_time = time.time()
+                    # 计算当前处理速度（文件/秒），使用单调时钟，不受系统时间调整影响
+                    current_time = time.monotonic()
                     elapsed_time = current_time - start_time
                     if elapsed_time > 0:
                         processing_speed = len(file_paths) / elapsed_time
@@ -893,7 +1046,7 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                     
                     # 检查是否可以增加线程数
                     # 基于成功计数和处理速度的综合判断
-                    if is_docker_environment():
+                    if is_docker:
                         # Docker环境下使用更激进的线程增加策略
                         # 针对不同类型目录进行特别优化
                         if has_disc_files:
@@ -918,11 +1071,7 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                             if has_disc_files and new_workers < max_workers and processing_speed > speed_threshold_high * 0.5:
                                 new_workers = min(max_workers, new_workers + 1)
                             logger.info(f"Docker环境下处理速度稳定{(', 原盘目录优化' if has_disc_files else '')}，增加线程数: {current_workers} -> {new_workers}")
-                            
-                            # 关闭当前线程池并创建新的
-                            executor.shutdown(wait=False)
-                            executor = concurrent.futures.ThreadPoolExecutor(max_workers=new_workers)
-                            current_workers = new_workers
+                            resize_workers(new_workers)
                     else:
                         # 非Docker环境保持原有策略
                         speed_threshold_high = 20.0  # 高于此速度且稳定时考虑增加线程
@@ -931,11 +1080,7 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                             # 实际调整线程数
                             new_workers = min(max_workers, current_workers + 1)
                             logger.info(f"SMB连接稳定且处理速度快，增加线程数: {current_workers} -> {new_workers}")
-                            
-                            # 关闭当前线程池并创建新的
-                            executor.shutdown(wait=False)
-                            executor = concurrent.futures.ThreadPoolExecutor(max_workers=new_workers)
-                            current_workers = new_workers
+                            resize_workers(new_workers)
                         
                         # 基于处理速度动态减少批处理延迟
                         if elapsed_time > 0:
@@ -952,11 +1097,8 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                         success_count = 0
                     
                     # 检查是否需要减少线程数
-                    # 基于错误计数、处理速度和路径类型的综合判断
-                    # 采样前10个文件来判断是否是WebDAV路径
-                    is_webdav_path = any(fp.startswith(('/vol02/CloudDrive/WebDAV', '/Volumes/CloudDrive/WebDAV')) for fp in temp_file_paths[:10] if fp)
-                    
-                    if is_docker_environment():
+                    # 基于错误计数、处理速度和路径类型的综合判断（is_webdav_path在收集文件前已确定）
+                    if is_docker:
                         # Docker环境下的线程调整策略
                         speed_threshold_low = 2.0  # 更低的速度阈值，避免频繁减少线程
                         docker_error_threshold = error_threshold * 2  # 更高的错误阈值
@@ -971,7 +1113,7 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                                 speed_threshold_low = 1.5  # 稍微提高速度阈值，减少线程减少的频率
                             
                         if ((error_count >= docker_error_threshold or 
-                             (elapsed_time > 10 and 'processing_speed' in locals() and processing_speed < speed_threshold_low)) and 
+                             (elapsed_time > 10 and processing_speed < speed_threshold_low)) and 
                             current_workers > min_workers):
                             # 实际减少线程数
                             new_workers = max(min_workers, current_workers - 1)
@@ -979,6 +1121,7 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                                 logger.info(f"[WebDAV] Docker环境下处理速度慢，减少线程数: {current_workers} -> {new_workers}")
                             else:
                                 logger.info(f"Docker环境下处理速度慢，减少线程数: {current_workers} -> {new_workers}")
+                            resize_workers(new_workers)
                     else:
                         # 非Docker环境保持原有策略
                         speed_threshold_low = 5.0  # 低于此速度时考虑减少线程
@@ -988,7 +1131,7 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                             speed_threshold_low = 1.5  # 更低的速度阈值
                             
                         if ((error_count >= error_threshold or 
-                             (elapsed_time > 5 and 'processing_speed' in locals() and processing_speed < speed_threshold_low)) and 
+                             (elapsed_time > 5 and processing_speed < speed_threshold_low)) and 
                             current_workers > min_workers):
                             # 实际减少线程数
                             new_workers = max(min_workers, current_workers - 1)
@@ -996,49 +1139,76 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                                 logger.info(f"[WebDAV] 连接错误增加或处理速度慢，减少线程数: {current_workers} -> {new_workers}")
                             else:
                                 logger.info(f"SMB连接错误增加或处理速度慢，减少线程数: {current_workers} -> {new_workers}")
-                        
-                        # 关闭当前线程池并创建新的
-                        executor.shutdown(wait=False)
-                        executor = concurrent.futures.ThreadPoolExecutor(max_workers=new_workers)
-                        current_workers = new_workers
-                        
-                        # 增加批处理延迟以减少连接压力
-                        if is_webdav_path:
-                            adaptive_batch_delay = min(adaptive_batch_delay * 1.2, scan_delay * 3)
-                            logger.info(f"[WebDAV] 增加批处理延迟: {adaptive_batch_delay:.2f}s")
-                        else:
-                            adaptive_batch_delay = min(adaptive_batch_delay * 1.5, scan_delay * 3)
-                            logger.info(f"增加批处理延迟: {adaptive_batch_delay:.2f}s")
-                        
-                        batch_delay = max(0.1, adaptive_batch_delay / (total_batches / 10))
-                        
-                        # 重置错误计数
-                        error_count = 0
+                            resize_workers(new_workers)
+                            
+                            # 增加批处理延迟以减少连接压力
+                            if is_webdav_path:
+                                adaptive_batch_delay = min(adaptive_batch_delay * 1.2, scan_delay * 3)
+                                logger.info(f"[WebDAV] 增加批处理延迟: {adaptive_batch_delay:.2f}s")
+                            else:
+                                adaptive_batch_delay = min(adaptive_batch_delay * 1.5, scan_delay * 3)
+                                logger.info(f"增加批处理延迟: {adaptive_batch_delay:.2f}s")
+                            
+                            batch_delay = max(0.1, adaptive_batch_delay / (total_batches / 10))
+                            
+                            # 重置错误计数
+                            error_count = 0
                 
-                # 确保线程池关闭
-                if executor._shutdown:  # 检查线程池是否已关闭
-                    pass
-                else:
-                    executor.shutdown(wait=True)
+                # 等待所有任务完成并关闭线程池
+                executor.shutdown(wait=True)
                 
-                elapsed = time.time() - start_time
+                elapsed = time.monotonic() - start_time
                 logger.info(f"并行处理完成，耗时 {elapsed:.2f} 秒，最终线程数: {current_workers}")
             else:
                 logger.info(f"开始单线程处理 {len(file_paths)} 个文件...")
-                start_time = time.time()
-                for root, dirs, files in os.walk(dir):
-                    dir_count += len(dirs)
-                    
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        if process_file(file_path):
-                            break  # 已达到最大文件数
-                    
-                    if max_files > 0 and len(file_paths) >= max_files:
-                        excluded_dir_count += len(dirs) - len(os.walk(root))
-                        break
+                start_time = time.monotonic()
+                # 文件元数据由一个小线程池成批并发获取（最多SMB_MAX_INFLIGHT个同时进行），
+                # 网络文件系统上多个stat请求的往返时间相互重叠，结果仍按顺序交给process_file处理
+                stat_executor = concurrent.futures.ThreadPoolExecutor(max_workers=SMB_MAX_INFLIGHT) if SMB_MAX_INFLIGHT > 1 else None
+                
+                def entry_size(entry):
+                    """获取目录项对应文件的大小（跟随软链接），失败时返回None，交给process_file按原有逻辑处理"""
+                    try:
+                        with inflight:
+                            return entry.stat().st_size
+                    except OSError:
+                        return None
                 
-                elapsed = time.time() - start_time
+                try:
+                    for root, subdir_entries, file_entries, root_fd in _walk_scandir(dir):
+                        dir_count += len(subdir_entries)
+                        
+                        reached_max_files = False
+                        pending_entries = file_entries
+                        while pending_entries and not reached_max_files:
+                            # 每一批最多获取剩余配额数量的文件信息，避免达到最大文件数后仍请求整个目录
+                            wave_size = max(1, max_files - len(file_paths) if max_files > 0 else len(pending_entries))
+                            wave, pending_entries = pending_entries[:wave_size], pending_entries[wave_size:]
+                            wave_paths = [os.path.join(root, entry.name) for entry in wave]
+                            
+                            if stat_executor is not None and len(wave) > 1:
+                                # 辅助文件在process_file中直接跳过，不需要获取文件信息
+                                stat_items = [(entry, file_path) for entry, file_path in zip(wave, wave_paths) if not _is_auxiliary_file(file_path)]
+                                file_sizes = stat_executor.map(entry_size, [entry for entry, _ in stat_items])
+                                for (_, file_path), file_size in zip(stat_items, file_sizes):
+                                    if file_size is not None:
+                                        known_sizes[file_path] = file_size
+                                touch_connection()
+                            
+                            for entry, file_path in zip(wave, wave_paths):
+                                if process_file(file_path, dir_fd=root_fd, name=entry.name):
+                                    reached_max_files = True
+                                    break  # 已达到最大文件数
+                        
+                        if max_files > 0 and len(file_paths) >= max_files:
+                            # 当前目录下尚未遍历的子目录
+                            excluded_dir_count += len(subdir_entries)
+                            break
+                finally:
+                    if stat_executor is not None:
+                        stat_executor.shutdown(wait=True)
+                
+                elapsed = time.monotonic() - start_time
                 logger.info(f"单线程处理完成，耗时 {elapsed:.2f} 秒")
             
             # 扫描完成后，确保SMB连接保持线程停止
@@ -1051,12 +1221,8 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                     logger.warning(f"停止SMB连接保持线程时发生错误: {str(e)}")
                 smb_thread = None  # 释放引用以帮助垃圾回收
             
-            # 清空预取缓存
-            if 'prefetch_cache' in locals():
-                prefetch_cache.clear()
-            
             # 记录SMB错误统计
-            if is_docker_environment():
+            if is_docker:
                 # 在Docker环境中，路径通过卷挂载，不涉及SMB连接
                 if smb_errors:
                     logger.debug(f"Docker环境下检测到文件访问错误: {len(smb_errors)}个 (注意：在Docker环境中这些不是SMB连接错误，而是文件系统访问问题)")
@@ -1083,8 +1249,24 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                 else:
                     logger.info("未检测到SMB连接错误，连接保持良好")
 
-            # [MOD] 2026-02-24 性能优化：使用流式写入，减少内存占用 by AI
-            # 对于大文件列表，直接流式写入，避免内存峰值
+            # 扫描结束后排序，并把快照内容（路径之间以\0分隔）按块编码为UTF-8，
+            # 不为每个路径单独创建bytes对象，也不构造整个快照大小的临时字符串（str按码位排序与UTF-8字节序一致）
+            file_paths.sort()
+            try:
+                snapshot_chunks = _encode_snapshot_chunks(file_paths)
+            except UnicodeEncodeError:
+                # 个别文件名无法编码（例如包含代理字符）时跳过这些文件
+                encodable_paths = []
+                for path in file_paths:
+                    try:
+                        path.encode('utf-8')
+                        encodable_paths.append(path)
+                    except UnicodeEncodeError as e:
+                        logger.warning(f"跳过无法编码的文件路径: {path!r}: {str(e)}")
+                file_paths = encodable_paths
+                snapshot_chunks = _encode_snapshot_chunks(file_paths)
+            file_count = len(file_paths)
+
             temp_output = output_file + ".tmp"
 
             # 即使有文件处理失败，也要尽可能保留已成功扫描的文件
@@ -1127,59 +1309,18 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
 
             # 写入临时文件
             try:
-                # [MOD] 对于大文件列表，使用流式写入
-                if len(file_paths) > 50000:
-                    logger.info(f"大文件列表 ({len(file_paths)} 个)，使用流式写入")
-                    with open(temp_output, 'wb') as f:
-                        # 先排序文件路径
-                        sorted_paths = sorted(file_paths)
-                        # 流式写入，每批10000个文件
-                        batch_write_size = 10000
-                        for i in range(0, len(sorted_paths), batch_write_size):
-                            batch = sorted_paths[i:i+batch_write_size]
-                            f.write(b'\x00'.join(batch))
-                            if i + batch_write_size < len(sorted_paths):
-                                f.write(b'\x00')
-                            # 定期刷新
-                            if i > 0 and i % 50000 == 0:
-                                f.flush()
-                        f.write(b'\x00')
-                        f.flush()
-                        os.fsync(f.fileno())
-                else:
-                    # 小文件列表直接写入
-                    files = sorted(file_paths)
-                    with open(temp_output, 'wb') as f:
-                        f.write(b'\x00'.join(files) + b'\x00')
-                        # 确保数据真正写入磁盘，不只是缓存
-                        f.flush()
-                        os.fsync(f.fileno())
-                
-                # 强制刷新文件系统缓存 - 增强版
-                if sys.platform == 'darwin':  # macOS系统
-                    subprocess.run(['sync'], check=False)
-                    # macOS特定的fsync刷新
-                    with open(temp_output, 'rb') as f:
-                        os.fsync(f.fileno())
-                else:
-                    subprocess.run(['sync'], check=False)
-                
-                # 检测是否在Docker环境中
-                is_docker = is_docker_environment()
-                
-                # 无论是否在Docker环境，都进行额外的文件系统刷新
-                wait_time = max(0.05, min(0.3, len(files) / 3000))  # 进一步降低等待时间和比例因子
-                logger.debug(f"写入临时文件后等待文件系统刷新... ({wait_time}秒)")
-                time.sleep(wait_time)
-                subprocess.run(['sync'], check=False)
-                
-                # 强制目录同步
+                if file_count > 50000:
+                    logger.info(f"大文件列表 ({file_count} 个)，快照大小: {sum(map(len, snapshot_chunks))} bytes")
+                # 已编码的数据块不经过Python缓冲区，成组直接写入文件
+                fd = os.open(temp_output, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
                 try:
-                    dir_fd = os.open(output_dir, os.O_RDONLY)
-                    os.fsync(dir_fd)
-                    os.close(dir_fd)
-                except Exception as e:
-                    logger.debug(f"目录同步失败: {str(e)}")
+                    _write_buffers(fd, snapshot_chunks)
+                    # 确保数据真正写入磁盘，不只是缓存
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                # fsync返回后临时文件内容已落盘，目录项在重命名后统一同步，
+                # 不再调用sync刷新整个系统的页缓存，也不需要额外等待
                 
                 # 验证临时文件是否存在且大小正确
                 if not os.path.exists(temp_output):
@@ -1197,7 +1338,6 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
             # 增强版文件重命名和验证机制
             max_rename_retries = 7  # 增加重试次数到7次
             rename_success = False
-            file_count = len(files)
             
             for attempt in range(max_rename_retries):
                 try:
@@ -1214,7 +1354,7 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                                 logger.error(f"恢复临时文件失败: {str(e)}")
                         else:
                             # 创建一个临时备份文件
-                            dummy_content = b'dummy_data\x00' if len(files) == 0 else b'\x00'.join(files[:10]) + b'\x00'
+                            dummy_content = b'dummy_data\x00' if file_count == 0 else ('\x00'.join(file_paths[:10]) + '\x00').encode('utf-8')
                             with open(temp_output, 'wb') as f:
                                 f.write(dummy_content)
                     
@@ -1234,22 +1374,8 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                                 logger.error(f"移除目标文件失败: {str(e2)}")
 
                     os.rename(temp_output, output_file)
-                    # 强制刷新文件系统缓存 - 增强版 (修复macOS上的文件识别问题) (修复macOS上的文件识别问题)
-                    if sys.platform == 'darwin':  # macOS系统
-                        subprocess.run(['sync'], check=False)
-                        # macOS特定的fsync刷新
-                        with open(output_file, 'rb') as f:
-                            os.fsync(f.fileno())
-                    else:
-                        subprocess.run(['sync'], check=False)
-                    
-                    # 无论是否在Docker环境，都进行额外的文件系统刷新
-                    wait_time = max(0.05, min(0.3, file_count / 3000))  # 进一步降低等待时间和比例因子
-                    logger.debug(f"重命名后等待文件系统刷新... ({wait_time}秒)")
-                    time.sleep(wait_time)
-                    subprocess.run(['sync'], check=False)
                     
-                    # 强制目录同步
+                    # 同步输出目录，使重命名后的目录项落盘（文件内容在写入临时文件时已fsync）
                     try:
                         dir_fd = os.open(output_dir, os.O_RDONLY)
                         os.fsync(dir_fd)
@@ -1288,18 +1414,12 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                             logger.error(f"临时文件不存在，无法复制")
                             break
                         
-                        with open(temp_output, 'rb') as f_src:
-                            with open(output_file, 'wb') as f_dst:
-                                # 使用分块读取写入，避免大文件内存问题
-                                chunk_size = 1024 * 1024  # 1MB块
-                                while True:
-                                    chunk = f_src.read(chunk_size)
-                                    if not chunk:
-                                        break
-                                    f_dst.write(chunk)
-                                # 确保数据真正写入磁盘，不只是缓存
-                                f_dst.flush()
-                                os.fsync(f_dst.fileno())
+                        # 由shutil.copyfile在内核中完成复制（Linux上使用sendfile，macOS上使用fcopyfile），
+                        # 数据不经过Python缓冲区
+                        shutil.copyfile(temp_output, output_file)
+                        # 确保数据真正写入磁盘，不只是缓存
+                        with open(output_file, 'rb') as f_dst:
+                            os.fsync(f_dst.fileno())
                         
                         # 验证复制是否成功
                         if os.path.exists(output_file) and os.path.getsize(output_file) == os.path.getsize(temp_output):
@@ -1349,7 +1469,7 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
             except UnicodeEncodeError:
                 contains_special_chars = True
             if contains_special_chars:
-                logger.debug(f"检测到包含特殊字符的目录：{dir}，将增加额外的同步操作")
+                logger.debug(f"检测到包含特殊字符的目录：{dir}，将增加检查失败后的等待时间")
                 
             # 增加针对双重挑战目录的特殊处理（同时是大型目录且包含特殊字符）
             is_double_challenge = is_large_directory and contains_special_chars
@@ -1357,68 +1477,10 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
                 logger.debug(f"检测到双重挑战目录（大型+特殊字符）：{dir}，将提供最高级别的处理")
                 max_check_retries = 10  # 优化：将双重挑战目录的检查次数从15减少到10
             
+            # 文件和目录在写入、重命名时均已fsync，这里直接检查，只在检查失败时等待后重试
+            is_webdav = is_webdav_mount
             for check_attempt in range(max_check_retries):
                 try:
-                    # 再次同步文件系统
-                    subprocess.run(['sync'], check=False)
-                    
-                    # 检测是否在Docker环境中
-                    is_docker = is_docker_environment()
-                    if is_docker:
-                        # 检查是否是WebDAV路径
-                        is_webdav = dir.startswith(('/vol02/CloudDrive/WebDAV', '/Volumes/CloudDrive/WebDAV'))
-                        
-                        # 在Docker环境中增加额外的等待时间
-                        # 为大型目录和特殊字符目录增加更多等待时间
-                        # 针对WebDAV路径设置更低的等待时间
-                        if is_webdav:
-                            base_wait_time = 0.4 if (is_large_directory or contains_special_chars) else 0.2  # 为WebDAV路径设置更低的基础等待时间
-                            wait_time = base_wait_time + (check_attempt * 0.2)  # 为WebDAV路径设置更低的递增等待时间系数
-                        else:
-                            base_wait_time = 1.0 if (is_large_directory or contains_special_chars) else 0.5
-                            wait_time = base_wait_time + (check_attempt * 0.5)
-                        logger.debug(f"Docker环境: 增强版检查前等待文件系统刷新... ({wait_time}秒)")
-                        time.sleep(wait_time)
-                        
-                        # 同步目录
-                        try:
-                            # 基础同步操作
-                            dir_fd = os.open(output_dir, os.O_RDONLY)
-                            os.fsync(dir_fd)
-                            os.close(dir_fd)
-                            
-                            # 针对不同类型目录的额外同步
-                            if is_double_challenge:
-                                # 为双重挑战目录提供最高级别的同步处理
-                                logger.debug("对双重挑战目录（大型+特殊字符）执行增强同步...")
-                                
-                                # 针对WebDAV路径设置更低的等待时间和更少的同步次数
-                                if is_webdav:
-                                    # 为WebDAV路径的双重挑战目录设置更低的等待时间和更少的同步次数
-                                    sync_count = 1  # 进一步减少到1次
-                                    sync_sleep = 0.4  # 进一步降低等待时间
-                                else:
-                                    # 保持原有的优化设置
-                                    sync_count = 2
-                                    sync_sleep = 0.8
-                                
-                                # 执行同步操作
-                                for i in range(sync_count):
-                                    time.sleep(sync_sleep)
-                                    dir_fd = os.open(output_dir, os.O_RDONLY)
-                                    os.fsync(dir_fd)
-                                    os.close(dir_fd)
-                                    logger.debug(f"双重挑战目录同步轮次 {i+1}/{sync_count} 完成")
-                            elif is_large_directory or contains_special_chars:
-                                # 对于大型目录或特殊字符目录，执行额外的同步操作
-                                logger.debug("对大型目录或特殊字符目录执行额外的目录同步...")
-                                time.sleep(0.3)  # 从0.5秒减少到0.3秒
-                                dir_fd = os.open(output_dir, os.O_RDONLY)  # 重新打开文件描述符
-                                os.fsync(dir_fd)
-                                os.close(dir_fd)
-                        except Exception as e:
-                            logger.debug(f"目录同步失败: {str(e)}")
-                    
                     if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
                         output_size = os.path.getsize(output_file)
                         logger.debug(f"增强版检查通过 (尝试 {check_attempt+1}/{max_check_retries}): 文件存在，大小: {output_size} bytes")
@@ -1470,8 +1532,7 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
             # 记录被忽略的小文件数量
             if skipped_small > 0:
                 # 检测是否是WebDAV路径
-                is_webdav_path = dir.startswith(('/vol02/CloudDrive/WebDAV', '/Volumes/CloudDrive/WebDAV'))
-                if is_webdav_path:
+                if is_webdav_mount:
                     logger.info(f"[WebDAV] 扫描目录 {dir}: 忽略了 {skipped_small} 个小于 {min_size_bytes/1024/1024:.2f} MB 的小文件")
                 else:
                     logger.info(f"扫描目录 {dir}: 忽略了 {skipped_small} 个小于 {min_size_bytes} 字节的小文件")
@@ -1496,7 +1557,7 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
             return -handle_error(ERROR_UNKNOWN, "生成快照过程中发生错误")
     
     # 记录开始时间用于调试
-    snapshot_start_time = time.time()
+    snapshot_start_time = time.monotonic()
     
     # 确保输出目录存在
     output_dir = os.path.dirname(output_file)
@@ -1505,7 +1566,7 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
     # 定义一个包装函数，用于在超时后检查快照是否实际已生成
     def _snapshot_wrapper():
         result = _generate_snapshot_core()
-        execution_time = time.time() - snapshot_start_time
+        execution_time = time.monotonic() - snapshot_start_time
         logger.debug(f"_generate_snapshot_core 执行完成，返回值: {result}，耗时: {execution_time:.2f}秒")
         return result
     
@@ -1515,7 +1576,8 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
         _snapshot_wrapper,
         timeout_seconds=timeout,
         default=-ERROR_TIMEOUT,  # 仅返回错误码，不立即记录错误
-        error_message=f"生成快照超时（{timeout}秒）"
+        error_message=f"生成快照超时（{timeout}秒）",
+        cancel_event=cancel_event
     )
     
     # 改进的额外检查：无论是否超时，都检查快照文件是否实际存在且有效
@@ -1542,7 +1604,7 @@ def generate_snapshot(dir, output_file, scan_delay=1, max_files=0, skip_large=Fa
         result = -handle_error(ERROR_TIMEOUT, f"生成快照超时（{timeout}秒）")
     
     # 记录最终结果和执行时间
-    execution_time = time.time() - snapshot_start_time
+    execution_time = time.monotonic() - snapshot_start_time
     logger.debug(f"generate_snapshot 函数执行完成，最终返回值: {result}，总耗时: {execution_time:.2f}秒")
     
     return result
@@ -1639,9 +1701,9 @@ def generate_incremental_snapshot(dir, output_file, previous_snapshot, scan_dela
             try:
                 with open(output_file, 'wb') as f:
                     f.write(b'\x00'.join(incremental_content) + b'\x00')
-                
-                # 强制刷新文件系统缓存
-                subprocess.run(['sync'], check=False)
+                    # 只同步增量快照文件本身，不刷新整个系统的页缓存
+                    f.flush()
+                    os.fsync(f.fileno())
                 
                 logger.info(f"增量快照生成完成，新增: {len(added)}，删除: {len(deleted)}")
             except Exception as e:
@@ -1725,9 +1787,9 @@ def apply_incremental_snapshot(base_snapshot, incremental_snapshot, output_file)
             try:
                 with open(temp_output, 'wb') as f:
                     f.write(b'\x00'.join(sorted(base_files)) + b'\x00')
-                
-                # 强制刷新文件系统缓存
-                subprocess.run(['sync'], check=False)
+                    # 只同步临时文件本身，不刷新整个系统的页缓存
+                    f.flush()
+                    os.fsync(f.fileno())
                 
                 # 重命名临时文件
                 os.rename(temp_output, output_file)
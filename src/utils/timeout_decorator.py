@@ -6,6 +6,7 @@ import threading
 import logging
 import time
 from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from typing import Optional
 from .environment import env_detector
 
@@ -104,7 +105,7 @@ def timeout(seconds=30, error_message="函数执行超时"):
     return decorator
 
 
-def run_with_timeout(func, *args, timeout_seconds=30, default=None, error_message=None, **kwargs):
+def run_with_timeout(func, *args, timeout_seconds=30, default=None, error_message=None, cancel_event=None, **kwargs):
     """在超时控制下运行函数的工具函数
     
     Args:
@@ -113,6 +114,7 @@ def run_with_timeout(func, *args, timeout_seconds=30, default=None, error_messag
         timeout_seconds (int): 超时时间（秒），默认为30秒
         default: 超时或出错时返回的默认值
         error_message (str): 自定义错误信息
+        cancel_event (threading.Event): 可选，超时后设置该事件，通知仍在运行的函数尽快退出
         kwargs: 函数的关键字参数
         
     Returns:
@@ -129,7 +131,13 @@ def run_with_timeout(func, *args, timeout_seconds=30, default=None, error_messag
         with ThreadPoolExecutor(max_workers=1) as executor:
             future = executor.submit(func, *args, **kwargs)
             # 等待函数执行完成或超时
-            result = future.result(timeout=actual_timeout)
+            try:
+                result = future.result(timeout=actual_timeout)
+            except FuturesTimeoutError:
+                # 离开with块时会等待函数结束，先通知函数取消
+                if cancel_event is not None:
+                    cancel_event.set()
+                raise
             execution_time = time.time() - start_time
             logger.debug(f"函数 {func.__name__} 执行完成，耗时: {execution_time:.2f}秒，未超时")
             return result